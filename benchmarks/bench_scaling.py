@@ -0,0 +1,103 @@
+"""Check that building the reports takes time linear in the number of cells and notebooks.
+
+Three measurements:
+
+- assembling a report of N cell rows, by growing a dataframe with the original `safe_concat()`
+  loop and by collecting records and building the dataframe once;
+- profiling corpora of N copies of a notebook with `nb_big_parse_nb()`, with no cell cache;
+- combining the per notebook reports for N notebooks with `collect_notebook_reports()`, using
+  made up reports so that corpora of tens of thousands of notebooks can be tried.
+
+For linear scaling the time per row, or per notebook, should stay roughly flat as N grows.
+
+    python benchmarks/bench_scaling.py [--rows 1000,2000,4000] [--notebooks 10,20,40,80]
+                                       [--stub-notebooks 10000,20000,40000] [NOTEBOOK]
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from nb_quality_profile.nb_visualiser import nb_big_parse_nb, collect_notebook_reports  # noqa: E402
+from nb_quality_profile.notebook_profiler import safe_concat  # noqa: E402
+
+
+def cell_record(i):
+    """A made up cell report row, with a mix of column types."""
+    return {"cell_index": i, "cell_type": "md" if i % 2 else "code", "n_words": i % 97,
+            "reading_time_s": i * 0.25, "filename": f"nb_{i // 50}.ipynb"}
+
+
+def concat_loop(n):
+    """Grow a report a row at a time, as the reports were originally built."""
+    df = pd.DataFrame()
+    for i in range(n):
+        df = safe_concat([df, pd.DataFrame([cell_record(i)])])
+    return df
+
+
+def from_records(n):
+    """Collect the rows as records and build the report once."""
+    return pd.DataFrame([cell_record(i) for i in range(n)])
+
+
+def stub_reports(n):
+    """Made up (fn, reports) pairs for `n` notebooks, with the reports that are collected per notebook."""
+    return [(Path(f"part{i % 20}/nb_{i:05d}.ipynb"),
+             {"cell_map": [(i % 7 + 1, "red"), (3, "green")], "imports": {"os", "sys"},
+              "text_report": {"reading_time": i % 300}})
+            for i in range(n)]
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("notebook", nargs="?", default=str(ROOT / "Notebook_profile_test.ipynb"))
+    parser.add_argument("--rows", default="1000,2000,4000")
+    parser.add_argument("--notebooks", default="10,20,40,80")
+    parser.add_argument("--stub-notebooks", default="10000,20000,40000")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'concat loop':>12} {'per row':>10} {'records':>10} {'per row':>10}")
+    for n in (int(s) for s in args.rows.split(",")):
+        t_loop, df_loop = timed(concat_loop, n)
+        t_records, df_records = timed(from_records, n)
+        pd.testing.assert_frame_equal(df_loop, df_records)
+        print(f"{n:>8} {t_loop:>11.2f}s {t_loop / n * 1e6:>8.0f}us"
+              f" {t_records:>9.3f}s {t_records / n * 1e6:>8.1f}us")
+
+    # Load the language model before timing anything
+    nb_big_parse_nb(args.notebook)
+    print()
+    print(f"{'notebooks':>9} {'cells':>8} {'profile':>10} {'per notebook':>13}")
+    for n in (int(s) for s in args.notebooks.split(",")):
+        with tempfile.TemporaryDirectory() as corpus:
+            for i in range(n):
+                shutil.copyfile(args.notebook, Path(corpus) / f"nb_{i:05d}.ipynb")
+            t, reports = timed(nb_big_parse_nb, corpus)
+        print(f"{n:>9} {len(reports['big_report_df']):>8} {t:>9.2f}s {t / n * 1000:>11.0f}ms")
+
+    print()
+    print(f"{'notebooks':>9} {'collect':>10} {'per notebook':>13}")
+    for n in (int(s) for s in args.stub_notebooks.split(",")):
+        notebook_reports = stub_reports(n)
+        t, reports = timed(collect_notebook_reports, notebook_reports)
+        assert all(len(reports[report]) == n for report in ["cell_map", "imports", "text_report"])
+        print(f"{n:>9} {t:>9.3f}s {t / n * 1e6:>11.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Time how long each `nb_quality` subcommand takes to run on a small notebook.
+
+Each command is run in a fresh process, with an empty cell cache, so the times include importing
+the package and, for the commands that need it, loading the spaCy model. Commands that don't
+use NLP (imports, check-warnings, alt-tags, chart) shouldn't load the model at all.
+
+    python benchmarks/bench_startup.py [--repeat 5] [--tree PATH ...] [NOTEBOOK]
+
+Pass `--tree` more than once to compare checkouts, e.g. a worktree of an older commit:
+
+    git worktree add /tmp/nbq-old <commit>
+    python benchmarks/bench_startup.py --tree . --tree /tmp/nbq-old
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+COMMANDS = {
+    "import": None,
+    "--help": ["--help"],
+    "imports": ["imports", "{nb}"],
+    "check-warnings": ["check-warnings", "{nb}"],
+    "alt-tags": ["alt-tags", "{nb}"],
+    "chart": ["chart", "{nb}"],
+    "text-analysis": ["text-analysis", "{nb}"],
+}
+
+
+def time_command(tree, args, nb, cwd):
+    """Run a command in a fresh Python process and return the wall clock time it took."""
+    if args is None:
+        code = "import nb_quality_profile.cli"
+        args = []
+    else:
+        code = "from nb_quality_profile.cli import cli; cli()"
+    with tempfile.TemporaryDirectory() as cache_home:
+        # Start from an empty cell cache every time
+        env = {**os.environ, "PYTHONPATH": str(tree), "XDG_CACHE_HOME": cache_home}
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", code, *[a.format(nb=nb) for a in args]],
+            cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("notebook", nargs="?", default=str(ROOT / "Notebook_profile_test.ipynb"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tree", action="append", help="Source tree to benchmark (default: this one)")
+    args = parser.parse_args()
+    trees = [Path(t).resolve() for t in args.tree or [ROOT]]
+    nb = str(Path(args.notebook).resolve())
+
+    print(f"{'command':<16}" + "".join(f"{str(t)[-30:]:>32}" for t in trees))
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, command in COMMANDS.items():
+            medians = [
+                statistics.median(time_command(tree, command, nb, cwd) for _ in range(args.repeat))
+                for tree in trees
+            ]
+            print(f"{name:<16}" + "".join(f"{m:>31.2f}s" for m in medians))
+
+
+if __name__ == "__main__":
+    main()
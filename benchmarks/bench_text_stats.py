@@ -0,0 +1,121 @@
+"""Compare the single pass `text_stats_summary()` and batched syllable counter with the
+original multi-pass implementations, on spaCy docs of increasing size.
+
+The original implementations are reproduced below as `reference_*` functions. The outputs
+are checked to be the same before anything is timed. The batched syllable counter is timed
+both with an empty syllable cache ("cold", used for the speedup) and with a full one ("warm").
+
+    python benchmarks/bench_text_stats.py [--sizes 5000,20000,80000] [--repeat 5]
+
+Sizes are (roughly) numbers of tokens. The markdown in the repository's notebooks is repeated
+to make up each doc.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from nb_quality_profile.notebook_profiler import get_nlp  # noqa: E402
+from nb_quality_profile import text_stats  # noqa: E402
+from nb_quality_profile.text_stats import count_syllables_batch, sentence_lengths, text_stats_summary  # noqa: E402
+
+
+def reference_count_syllables(word):
+    """The original syllable counter: one regex split per word."""
+    return len(
+        [
+            "".join(g)
+            for g in re.findall(r"[aeiou]+|[^aeiou]+", word.lower())
+            if g[0] in "aeiou"
+        ]
+    )
+
+
+def reference_text_stats_counts(doc):
+    """The original counts from `text_stats_summary()`, walking the doc once per count."""
+    n_words = len([token for token in doc if not token.is_punct and not token.is_space])
+    n_sents = len(list(doc.sents))
+    n_unique_words = len(
+        set([token.text.lower() for token in doc if not token.is_punct and not token.is_space])
+    )
+    syllables = [reference_count_syllables(token.text) for token in doc if not token.is_punct and not token.is_space]
+    n_syllables = sum(syllables)
+    n_monosyllable_words = sum(1 for s in syllables if s == 1)
+    n_polysyllable_words = sum(1 for s in syllables if s >= 3)
+    n_long_words = sum(1 for token in doc if len(token.text) > 6 and not token.is_punct and not token.is_space)
+    s_lengths, s_mean, s_median, s_stdev = sentence_lengths(doc)
+    return {
+        "n_chars": len(doc.text),
+        "n_words": n_words,
+        "n_sents": n_sents,
+        "n_unique_words": n_unique_words,
+        "n_syllables": n_syllables,
+        "n_monosyllable_words": n_monosyllable_words,
+        "n_polysyllable_words": n_polysyllable_words,
+        "n_long_words": n_long_words,
+        "sentence_length_mean": s_mean,
+        "sentence_length_median": s_median,
+        "sentence_length_stdev": s_stdev,
+        "sentence_legths": s_lengths,
+    }
+
+
+def sample_markdown():
+    """Get the markdown from the notebooks in the repository."""
+    cells = []
+    for fn in sorted(ROOT.glob("*.ipynb")):
+        nb = json.loads(fn.read_text())
+        cells.extend("".join(c["source"]) for c in nb["cells"] if c["cell_type"] == "markdown")
+    return "\n\n".join(cells)
+
+
+def best_time(f, repeat):
+    """Get the best of `repeat` timings of calling `f()`."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="5000,20000,80000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    nlp = get_nlp("minimal")
+    md = sample_markdown()
+    n_md_tokens = len(nlp.make_doc(md))
+
+    print(f"{'tokens':>8} {'summary (ref)':>14} {'summary':>10} {'speedup':>8}"
+          f" {'syllables (ref)':>16} {'cold':>10} {'warm':>10} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        text = "\n\n".join([md] * max(1, round(size / n_md_tokens)))
+        nlp.max_length = max(nlp.max_length, len(text) + 1)
+        doc = nlp(text)
+
+        counts, _ = text_stats_summary(doc)
+        assert counts == reference_text_stats_counts(doc), "text_stats_summary() output has changed"
+        words = [t.text for t in doc if not t.is_punct and not t.is_space]
+        assert count_syllables_batch(words).tolist() == [reference_count_syllables(w) for w in words]
+
+        t_ref = best_time(lambda: reference_text_stats_counts(doc), args.repeat)
+        t_new = best_time(lambda: text_stats_summary(doc), args.repeat)
+        s_ref = best_time(lambda: [reference_count_syllables(w) for w in words], args.repeat)
+        # With the syllable cache emptied before each run, and then with it already holding the words
+        s_cold = best_time(lambda: (text_stats._SYLLABLE_CACHE.clear(), count_syllables_batch(words)), args.repeat)
+        s_warm = best_time(lambda: count_syllables_batch(words), args.repeat)
+        print(f"{len(doc):>8} {t_ref * 1000:>12.1f}ms {t_new * 1000:>8.1f}ms {t_ref / t_new:>7.1f}x"
+              f" {s_ref * 1000:>14.1f}ms {s_cold * 1000:>8.1f}ms {s_warm * 1000:>8.1f}ms {s_ref / s_cold:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# Persistent, content addressed cache of cell reports,
+# along with a manifest of the reports generated for each notebook file
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+# Bump this whenever the way a cell report is generated changes,
+# so that reports cached by earlier versions are no longer used
+CELL_METRICS_VERSION = 1
+
+CACHE_DB = "cell_cache.sqlite"
+IN_MEMORY = ":memory:"
+
+# Maximum size of the cached cell reports and stored notebook file reports, in bytes
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+
+def default_cache_dir():
+    """Get the default cache directory."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache")
+    return os.path.join(cache_home, "nb_quality_profile")
+
+
+def source_hash(source):
+    """Get the hash of a cell's source."""
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def _file_hash(fn):
+    """Get the hash of a file's contents."""
+    with open(fn, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def read_file(fn):
+    """Read a file, along with a (modification time, size, content hash) stamp for the bytes that were read.
+
+    The stamp is what `CellCache.put_file()` records for the reports generated from those bytes.
+    The file is statted before it is read, so if it is saved while it is being read (or profiled),
+    it will look changed the next time round rather than being matched with stale reports."""
+    stat = os.stat(fn)
+    with open(fn, "rb") as f:
+        data = f.read()
+    return data, (stat.st_mtime_ns, stat.st_size, hashlib.sha256(data).hexdigest())
+
+
+def _encode_file_reports(reports):
+    """Get the reports for a notebook file as JSON text, and its cell reports, if there are any, as Parquet bytes.
+
+    Nothing executable is stored, so a cache directory shared between machines can be loaded safely.
+    Returns None if there are cell reports but pyarrow isn't installed to save them."""
+    from .shards import _encode_reports, _encode_cells
+    stored = {"reports": _encode_reports(reports), "cells": None}
+    cells = None
+    if "big_report" in reports:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return None
+        ddf, stored["cells"] = _encode_cells(reports["big_report"], 0)
+        buf = io.BytesIO()
+        ddf.to_parquet(buf, index=False)
+        cells = buf.getvalue()
+    return json.dumps(stored), cells
+
+
+def _decode_file_reports(stored, cells):
+    """Restore the reports for a notebook file saved by `_encode_file_reports()`."""
+    from .shards import _decode_reports, _decode_cells
+    stored = json.loads(stored)
+    reports = _decode_reports(stored["reports"])
+    if stored["cells"] is not None:
+        import pandas as pd
+        reports["big_report"] = _decode_cells(pd.read_parquet(io.BytesIO(cells)), stored["cells"])
+    return reports
+
+
+def _package_version(package):
+    """Get the version of an installed package without importing it."""
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # Python < 3.8
+        from pkg_resources import get_distribution as _get_distribution
+        from pkg_resources import DistributionNotFound as PackageNotFoundError
+
+        def version(package):
+            return _get_distribution(package).version
+
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return ""
+
+
+class CellCache:
+    """Cache of cell reports, keyed by a hash of the cell source, cell type and report configuration.
+
+    The cache also keeps a manifest of the reports generated for each notebook file,
+    along with the file's size, modification time and content hash, so that the reports
+    for unchanged files can be reused without reading the notebook at all.
+    The stored file reports count towards the maximum size of the cache, and are evicted
+    along with the cell reports, least recently used first."""
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        if cache_dir == IN_MEMORY:
+            # A cache that only lasts as long as the process
+            self.cache_dir = None
+            self.conn = sqlite3.connect(IN_MEMORY)
+        else:
+            self.cache_dir = Path(cache_dir or default_cache_dir())
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.cache_dir / CACHE_DB), timeout=30)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS cells (
+                key TEXT PRIMARY KEY, report TEXT, size INTEGER, accessed REAL)"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cells_accessed ON cells (accessed)")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(files)")]
+        if columns and "cells" not in columns:
+            # A manifest saved by an earlier version, which pickled the reports and didn't keep track of their size
+            self.conn.execute("DROP TABLE files")
+        # `size` is the size of the notebook file, and `stored_size` the size of its stored reports;
+        # the reports are stored as JSON, and the cell reports as Parquet (see `_encode_file_reports()`)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                path TEXT, context TEXT, mtime INTEGER, size INTEGER, hash TEXT, reports TEXT, cells BLOB,
+                stored_size INTEGER, accessed REAL, PRIMARY KEY (path, context))"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_accessed ON files (accessed)")
+        self.conn.commit()
+        self._size = (self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cells").fetchone()[0]
+                      + self.conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM files").fetchone()[0])
+        self._contexts = {}
+
+    def context(self, cell_type, model="", nlp_profile=""):
+        """Get the report configuration that a cached cell report depends on."""
+        if cell_type != "markdown":
+            return f"{CELL_METRICS_VERSION}"
+        if (model, nlp_profile) not in self._contexts:
+            # Markdown reports also depend on the spacy version, language model version and pipeline profile
+            self._contexts[(model, nlp_profile)] = ":".join(
+                [
+                    str(CELL_METRICS_VERSION),
+                    _package_version("spacy"),
+                    model,
+                    _package_version(model),
+                    nlp_profile,
+                ]
+            )
+        return self._contexts[(model, nlp_profile)]
+
+    def key(self, source, cell_type, model="", nlp_profile="", _source_hash=None):
+        """Generate the cache key for a cell.
+
+        If the hash of the cell source is already known, it can be passed in as `_source_hash`."""
+        context = self.context(cell_type, model, nlp_profile)
+        return hashlib.sha256(
+            "\0".join([cell_type, context, _source_hash or source_hash(source)]).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key):
+        """Get a cached cell report dict, or None if the cell isn't cached."""
+        row = self.conn.execute("SELECT report FROM cells WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.conn.execute("UPDATE cells SET accessed = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, report):
+        """Cache a cell report dict."""
+        report = json.dumps(report)
+        # A report that replaces an existing one frees up the space the old one took
+        row = self.conn.execute("SELECT size FROM cells WHERE key = ?", (key,)).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cells (key, report, size, accessed) VALUES (?, ?, ?, ?)",
+            (key, report, len(report), time.time()),
+        )
+        self._size = self._size + len(report) - (row[0] if row else 0)
+
+    def get_file(self, fn, context):
+        """Get the stored reports for a notebook file, or None if the file is new or has changed."""
+        path = str(Path(fn).resolve())
+        row = self.conn.execute(
+            "SELECT mtime, size, hash, reports, cells FROM files WHERE path = ? AND context = ?", (path, context)
+        ).fetchone()
+        if row is None or not os.path.isfile(path):
+            return None
+        mtime, size, _hash, reports, cells = row
+        stat = os.stat(path)
+        if (stat.st_mtime_ns, stat.st_size) != (mtime, size):
+            # The file may have been touched or copied without its contents changing
+            if stat.st_size != size or _file_hash(path) != _hash:
+                return None
+        self.conn.execute(
+            "UPDATE files SET mtime = ?, accessed = ? WHERE path = ? AND context = ?",
+            (stat.st_mtime_ns, time.time(), path, context),
+        )
+        try:
+            return _decode_file_reports(reports, cells)
+        except ImportError:
+            # The cell reports were saved by an installation with pyarrow
+            return None
+
+    def put_file(self, fn, context, reports, stamp):
+        """Store the reports for a notebook file.
+
+        `stamp` is the stamp of the file contents the reports were generated from (see `read_file()`),
+        rather than of the file as it is now, which may have been saved again since it was read.
+        Reports that include cell reports are only stored if pyarrow is installed."""
+        path = str(Path(fn).resolve())
+        mtime, size, _hash = stamp
+        stored = _encode_file_reports(reports)
+        if stored is None:
+            return
+        reports, cells = stored
+        stored_size = len(reports) + len(cells or b"")
+        row = self.conn.execute(
+            "SELECT stored_size FROM files WHERE path = ? AND context = ?", (path, context)
+        ).fetchone()
+        self.conn.execute(
+            """INSERT OR REPLACE INTO files (path, context, mtime, size, hash, reports, cells, stored_size, accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (path, context, mtime, size, _hash, reports, cells, stored_size, time.time()),
+        )
+        self._size = self._size + stored_size - (row[0] if row else 0)
+
+    def prune_files(self, roots, seen):
+        """Forget the reports for files below the `roots` directories that are not in `seen`,
+        e.g. because they have been deleted."""
+        seen = {str(Path(fn).resolve()) for fn in seen}
+        for root in roots:
+            root = os.path.join(str(Path(root).resolve()), "")
+            stale = [
+                (path,)
+                for (path,) in self.conn.execute(
+                    "SELECT DISTINCT path FROM files WHERE substr(path, 1, ?) = ?", (len(root), root)
+                )
+                if path not in seen
+            ]
+            for (path,) in stale:
+                (freed,) = self.conn.execute(
+                    "SELECT COALESCE(SUM(stored_size), 0) FROM files WHERE path = ?", (path,)
+                ).fetchone()
+                self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                self._size = self._size - freed
+
+    def size(self):
+        """Get the (approximate) total size of the cached cell reports and stored file reports in bytes."""
+        return self._size
+
+    def evict(self):
+        """Evict the least recently used cell reports and stored file reports
+        until the cache is back under its maximum size."""
+        excess = self.size() - self.max_size
+        if excess <= 0:
+            return
+        # Free up a little more than we need to so we aren't evicting on every flush
+        excess = excess + self.max_size // 10
+        evicted_cells = []
+        evicted_files = []
+        for key, context, size, _ in self.conn.execute(
+            """SELECT key, NULL, size, accessed FROM cells
+                UNION ALL SELECT path, context, stored_size, accessed FROM files
+                ORDER BY accessed"""
+        ):
+            if context is None:
+                evicted_cells.append((key,))
+            else:
+                evicted_files.append((key, context))
+            excess = excess - size
+            self._size = self._size - size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM cells WHERE key = ?", evicted_cells)
+        self.conn.executemany("DELETE FROM files WHERE path = ? AND context = ?", evicted_files)
+
+    def flush(self):
+        """Apply size based eviction and write any changes to disk."""
+        self.evict()
+        self.conn.commit()
+
+    def clear(self):
+        """Remove all the cached cell reports and stored file reports."""
+        self.conn.execute("DELETE FROM cells")
+        self.conn.execute("DELETE FROM files")
+        self.conn.commit()
+        self._size = 0
+
+    def close(self):
+        """Flush and close the cache."""
+        self.flush()
+        self.conn.close()
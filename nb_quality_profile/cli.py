@@ -1,13 +1,57 @@
 import click
 from .nb_visualiser import nb_vis_parse_nb, nb_imports_parse_nb, nb_text_parse_nb
+from .notebook_profiler import NLP_PROFILES, DEFAULT_NLP_PROFILE
+from .cell_cache import CellCache, IN_MEMORY
 
 from pathlib import Path
-import urllib
 
 @click.group()
 def cli():
 	pass
 
+def _open_cell_cache(cache, cache_dir, watch):
+	"""Open the cell cache. When watching, we always need a cache so that only changed notebooks are reprocessed."""
+	if cache:
+		return CellCache(cache_dir)
+	return CellCache(IN_MEMORY) if watch else None
+
+def _open_link_cache(cache, cache_dir, max_age=None, max_error_age=None):
+	"""Open the link status cache. The maximum ages are given in hours."""
+	if not cache:
+		return None
+	from .link_cache import LinkCache, LINK_OK_TTL, LINK_ERROR_TTL
+	return LinkCache(cache_dir,
+					 ok_ttl=LINK_OK_TTL if max_age is None else max_age * 60 * 60,
+					 error_ttl=LINK_ERROR_TTL if max_error_age is None else max_error_age * 60 * 60)
+
+def _open_report_writer(report_format, report_out):
+	"""Open a writer for the cell reports, or return None if they are just to be summarised as text."""
+	if report_format == 'text':
+		return None
+	from .report_writer import ParquetReportWriter, BackgroundReportWriter
+	try:
+		# Write the reports in the background while the next notebooks are profiled
+		return BackgroundReportWriter(ParquetReportWriter(report_out))
+	except ImportError as e:
+		raise click.ClickException(str(e))
+
+def _open_text_store(text_store):
+	"""Open the text store, if the cell text is to be kept out of the cell reports."""
+	if text_store is None:
+		return None
+	from .text_store import TextStore
+	return TextStore(text_store)
+
+def _watch(path, report):
+	"""Run a report, and then rerun it whenever the notebooks on a path change."""
+	from .watch import watch
+	click.echo('Watching {} for changes (Ctrl-C to stop)...'.format(path))
+	def _update():
+		click.echo('Notebooks changed, updating...')
+		report()
+	# Start watching before the first run, so saves made during it aren't missed
+	watch(path, _update, first_run=report)
+
 # In the click path arguments, setting: type=click.Path(exists=True)
 # fails if ther is a glob * in the provided path. Ideally, we would
 # be able to check for whether any path exists on the supplied path
@@ -20,14 +64,31 @@ def cli():
 @click.option('--linewidth', '-l', default=5, type=int, help='Line width')
 @click.option('--text-formats/--no-text-formats', default=True, help="Enable/disable Jupytext support.")
 @click.option('--path-filter', '-p', default=None,help="Filter phrase for directory path")
-def chart(path, out, gap, gapcolor, linewidth, text_formats, path_filter):
+@click.option('--cache/--no-cache', default=True, help="Enable/disable the cell report cache.")
+@click.option('--cache-dir', default=None, help="Cell report cache directory.")
+@click.option('--watch', is_flag=True, help="Update the chart whenever the notebooks change.")
+@click.option('--jobs', '-j', default=1, type=click.IntRange(min=1), help="Number of worker processes.")
+def chart(path, out, gap, gapcolor, linewidth, text_formats, path_filter, cache, cache_dir, watch, jobs):
 	"""Display notebook profile chart from provided file or directory path."""
 	click.echo('Using file/directory: {}'.format(path))
+	cell_cache = _open_cell_cache(cache, cache_dir, watch)
 	#nb_vis_parse_nb('../Documents/GitHub/tm351-undercertainty/notebooks/tm351/Part 02 Notebooks',
     #        linewidth=10, gap=0, img_file='test-nbvis.png')
-	nb_vis_parse_nb(path, img_file=out,  linewidth = linewidth,
-					w=20, gap=gap, gap_boost=1, gap_colour=gapcolor,
-					text_formats=text_formats, path_filter=path_filter)
+	def _chart():
+		nb_vis_parse_nb(path, img_file=out,  linewidth = linewidth,
+						w=20, gap=gap, gap_boost=1, gap_colour=gapcolor,
+						text_formats=text_formats, path_filter=path_filter,
+						cell_cache=cell_cache, jobs=jobs)
+		if watch:
+			# Don't hang on to every chart we draw
+			import matplotlib.pyplot as plt
+			plt.close('all')
+	if watch:
+		_watch(path, _chart)
+	else:
+		_chart()
+	if cell_cache is not None:
+		cell_cache.close()
 
 
 @cli.command()
@@ -44,10 +105,35 @@ def imports(path, text_formats):
 			   help="Enable/disable Jupytext support.")
 @click.option('--reading-rate', '-r', default=100, type=int, help='Words per minute.')
 @click.option('--rounded-minutes', '-R', is_flag=True, help='Round up to minutes.')
-def text_analysis(path, text_formats, reading_rate, rounded_minutes):
+@click.option('--nlp-profile', default=DEFAULT_NLP_PROFILE, type=click.Choice(list(NLP_PROFILES)),
+			  help="spaCy pipeline profile.")
+@click.option('--cache/--no-cache', default=True, help="Enable/disable the cell report cache.")
+@click.option('--cache-dir', default=None, help="Cell report cache directory.")
+@click.option('--watch', is_flag=True, help="Update the report whenever the notebooks change.")
+@click.option('--format', 'report_format', default='text', type=click.Choice(['text', 'parquet']),
+			  help="Summarise the cell reports as text, or write them to a Parquet dataset.")
+@click.option('--report-out', default='nb_quality_report.parquet', help='Parquet dataset outdir')
+@click.option('--text-store', default=None,
+			  help="Keep the cell text in this deduplicated store file rather than in every cell report.")
+@click.option('--jobs', '-j', default=1, type=click.IntRange(min=1), help="Number of worker processes.")
+def text_analysis(path, text_formats, reading_rate, rounded_minutes, nlp_profile, cache, cache_dir, watch,
+				  report_format, report_out, text_store, jobs):
 	"""Report on text / markdown content."""
 	click.echo('Using file/directory: {}'.format(path))
-	nb_text_parse_nb(path, text_formats, reading_rate, rounded_minutes)
+	cell_cache = _open_cell_cache(cache, cache_dir, watch)
+	text_store = _open_text_store(text_store)
+	def _text_analysis():
+		nb_text_parse_nb(path, text_formats, reading_rate, rounded_minutes, nlp_profile=nlp_profile,
+						 cell_cache=cell_cache, report_writer=_open_report_writer(report_format, report_out),
+						 text_store=text_store, jobs=jobs)
+	if watch:
+		_watch(path, _text_analysis)
+	else:
+		_text_analysis()
+	if cell_cache is not None:
+		cell_cache.close()
+	if text_store is not None:
+		text_store.close()
 
 @cli.command()
 @click.argument('path')
@@ -60,6 +146,10 @@ def alt_tags(path, grab_images, report):
 	click.echo('\nChecking image alt text for documents in file/directory: {}'.format(path))
 	
 	retvals = nb_md_links_and_images(path)
+	_alt_tags_report(retvals, grab_images, report)
+
+def _alt_tags_report(retvals, grab_images, report):
+	"""Report on image alt text from the links and images extracted from some notebooks."""
 	missing_alt_text=[]
 	if not retvals:
 		click.echo('\nNo images found in any of the notebooks.')
@@ -67,33 +157,26 @@ def alt_tags(path, grab_images, report):
 	
 	grab_images = grab_images or report
 
-	if grab_images:
-		img_path = Path("grab_images")
-		img_path.mkdir(parents=True, exist_ok=True)
-
-	biglist = []
 	for nb in retvals:
 		_missing_alt_text = [(nb["notebook"], i) for i in nb["images"] if not i[1]]
 		missing_alt_text.extend(_missing_alt_text)
-		if grab_images:
-			nb_path = Path(nb["notebook"]).resolve().parent
-			for i in nb["images"]:
-				src = nb_path / i[0]
-				dest = img_path / i[0]
-				if i[0].startswith("http"):
-					urllib.urlretrieve(i[0], dest)
-				else:
-					if src.is_file():
-						# We could also check it is an image file
-						dest.write_bytes(src.read_bytes())
-
-		if report:
-			for i in nb["images"]:
-				biglist.append([nb["notebook"], i[1], src, dest,
-				 f'![{i[1]}]({dest})'])
-			report_fn = "nb_images_report.html"
+
+	if grab_images:
+		from .image_collector import image_source, collect_images
+
+		# Resolve each image relative to its notebook, so an image used by several notebooks is only grabbed once
+		sources = [[image_source(i[0], Path(nb["notebook"]).resolve().parent) for i in nb["images"]]
+				   for nb in retvals]
+		grabbed = collect_images(src for nb_sources in sources for src in nb_sources)
 
 	if report:
+		biglist = []
+		for nb, nb_sources in zip(retvals, sources):
+			for i, src in zip(nb["images"], nb_sources):
+				dest = grabbed.get(src) or ""
+				biglist.append([nb["notebook"], i[1], src or i[0], dest,
+				 f'![{i[1]}]({dest})' if dest else ""])
+		report_fn = "nb_images_report.html"
 		from tabulate import tabulate
 		with open(report_fn, 'w') as f:
 			f.write(tabulate(biglist,
@@ -112,7 +195,15 @@ def alt_tags(path, grab_images, report):
 @click.argument('path')
 @click.option('--all-links', is_flag=True, help="Display all links.")
 @click.option('--grab-screenshots', is_flag=True, help="Grab screenshots.")
-def link_check(path, all_links, grab_screenshots):
+@click.option('--concurrency', default=32, type=click.IntRange(min=1), help="Maximum number of links checked at once.")
+@click.option('--timeout', default=10, type=float, help="Timeout for checking each link, in seconds.")
+@click.option('--cache/--no-cache', default=True, help="Enable/disable the link status cache.")
+@click.option('--cache-dir', default=None, help="Link status cache directory.")
+@click.option('--max-age', default=7 * 24, type=float,
+			  help="Reuse the cached status of a working link checked within this many hours.")
+@click.option('--max-error-age', default=1, type=float,
+			  help="Reuse the cached status of a broken link checked within this many hours.")
+def link_check(path, all_links, grab_screenshots, concurrency, timeout, cache, cache_dir, max_age, max_error_age):
 	"""Check links."""
 	click.echo('\nChecking links in documents in file/directory: {}'.format(path))
 
@@ -125,13 +216,25 @@ def link_check(path, all_links, grab_screenshots):
 
 	retvals = nb_md_links_and_images(path)
 	# Returns list of (text, href) tuples
+	link_cache = _open_link_cache(cache, cache_dir, max_age, max_error_age)
+	_link_check_report(retvals, all_links, grab_screenshots,
+					   concurrency=concurrency, timeout=timeout, link_cache=link_cache)
+	if link_cache is not None:
+		link_cache.close()
 
-	from ouxml_link_checker import link_checker as olc
+def _link_check_report(retvals, all_links, grab_screenshots, **kwargs):
+	"""Check the links extracted from some notebooks."""
+	from .link_checker import check_links
 
+	# Each distinct link is only checked once, however many notebooks it appears in
+	try:
+		link_reports = check_links((l[1] for nb in retvals for l in nb["links"]), **kwargs)
+	except ImportError as e:
+		raise click.ClickException(str(e))
 	reps = {}
 	for nb in retvals:
 		# Generate report of form: nb, linktext, link, report
-		reps[nb["notebook"]] = [(l[0], l[1], olc.link_reporter(l[1])) for l in nb["links"]]
+		reps[nb["notebook"]] = [(l[0], l[1], link_reports[l[1]]) for l in nb["links"]]
 
 	for nb in reps:
 		if all_links:
@@ -198,12 +301,147 @@ def check_warnings(path, out):
 	"""Check code output cells for warnings."""
 	from .notebook_profiler import get_warnings
 
+	_warnings_report(get_warnings(path), out)
+
+def _warnings_report(warnings, out):
+	"""Report on the warnings found in some notebooks."""
 	if out:
 		from tabulate import tabulate
 		with Path(out).open('w') as f:
-			f.write(tabulate(get_warnings(path), 
+			f.write(tabulate(warnings, 
 					headers=["path", "cell", "source", "warning"],
 					tablefmt='unsafehtml'))
 		click.echo(f"Report saved to: {out}")
 	else:
-		click.echo(get_warnings(path))
+		click.echo(warnings)
+
+# The reports (see `nb_visualiser.NB_ANALYSERS`) needed by each analysis
+ANALYSES = {
+	'chart': ['cell_map'],
+	'imports': ['imports'],
+	'text-analysis': ['imports', 'big_report'],
+	'alt-tags': ['links_and_images'],
+	'link-check': ['links_and_images'],
+	'check-warnings': ['warnings'],
+}
+
+@cli.command(name='all')
+@click.argument('path')
+@click.option('--analysis', '-a', 'analyses', multiple=True, type=click.Choice(list(ANALYSES)),
+			  help="Analysis to run (may be repeated; default: run them all).")
+@click.option('--out', '-o', default='nb_quality_review.png',  help='Chart image outfile')
+@click.option('--warnings-out', default="warnings_report.html",  help='Warnings report outfile')
+@click.option('--text-formats/--no-text-formats', default=True, help="Enable/disable Jupytext support.")
+@click.option('--reading-rate', '-r', default=100, type=int, help='Words per minute.')
+@click.option('--rounded-minutes', '-R', is_flag=True, help='Round up to minutes.')
+@click.option('--nlp-profile', default=DEFAULT_NLP_PROFILE, type=click.Choice(list(NLP_PROFILES)),
+			  help="spaCy pipeline profile.")
+@click.option('--cache/--no-cache', default=True, help="Enable/disable the cell report and link status caches.")
+@click.option('--cache-dir', default=None, help="Cell report and link status cache directory.")
+@click.option('--format', 'report_format', default='text', type=click.Choice(['text', 'parquet']),
+			  help="Summarise the cell reports as text, or write them to a Parquet dataset.")
+@click.option('--report-out', default='nb_quality_report.parquet', help='Parquet dataset outdir')
+@click.option('--text-store', default=None,
+			  help="Keep the cell text in this deduplicated store file rather than in every cell report.")
+@click.option('--jobs', '-j', default=1, type=click.IntRange(min=1), help="Number of worker processes.")
+@click.option('--shard', default=None,
+			  help="Only profile the i'th of N shards of the notebooks (i/N), and save the partial results.")
+@click.option('--partial-out', default=None,
+			  help="Partial results outdir for --shard (default: nb_quality_shard_<i>_of_<N>).")
+def all_analyses(path, analyses, out, warnings_out, text_formats, reading_rate, rounded_minutes,
+				 nlp_profile, cache, cache_dir, report_format, report_out, text_store, jobs, shard, partial_out):
+	"""Run several analyses with a single walk and parse of the notebooks on the provided file or directory path."""
+	from .nb_visualiser import nb_big_parse_nb
+
+	analyses = analyses or list(ANALYSES)
+	if shard is not None:
+		from .shards import parse_shard
+		try:
+			shard = parse_shard(shard)
+		except ValueError as e:
+			raise click.BadParameter(str(e), param_hint="'--shard'")
+		if text_store is not None or report_format != 'text':
+			# Text store offsets and Parquet datasets are local to each shard, so can't be merged
+			raise click.UsageError("--shard can't be used with --text-store or --format parquet.")
+		partial_out = partial_out or f"nb_quality_shard_{shard[0]}_of_{shard[1]}"
+		if 'text-analysis' in analyses:
+			# The partial cell reports are saved as Parquet
+			from .report_writer import _import_pyarrow
+			try:
+				_import_pyarrow()
+			except ImportError as e:
+				raise click.ClickException(str(e))
+	click.echo('Using file/directory: {}'.format(path))
+	cell_cache = _open_cell_cache(cache, cache_dir, False)
+	report_writer = _open_report_writer(report_format, report_out) if 'text-analysis' in analyses else None
+	text_store = _open_text_store(text_store)
+	# Each notebook is parsed once, and the parsed notebook is handed to each of the analyses
+	reports = nb_big_parse_nb(path, text_formats, reading_rate=reading_rate, rounded_minutes=rounded_minutes,
+							  nlp_profile=nlp_profile, cell_cache=cell_cache,
+							  analyses=sorted({r for analysis in analyses for r in ANALYSES[analysis]}),
+							  report_writer=report_writer, text_store=text_store, jobs=jobs,
+							  shard=shard, partial_out=partial_out, partial_meta={'cli_analyses': list(analyses)})
+	if cell_cache is not None:
+		cell_cache.close()
+	if text_store is not None:
+		text_store.close()
+
+	if shard is not None:
+		click.echo(f"\nPartial results for shard {shard[0]}/{shard[1]} saved to: {partial_out}")
+		click.echo("Merge the partial results for all the shards with: nb_quality merge")
+		return
+	_all_analyses_report(path, analyses, reports, out, warnings_out, report_writer, cache, cache_dir)
+
+def _all_analyses_report(path, analyses, reports, out, warnings_out, report_writer, cache, cache_dir):
+	"""Run the analyses on the reports from a big parse of the notebooks on a path."""
+	if 'chart' in analyses:
+		nb_vis_parse_nb(path, img_file=out, linewidth=5, w=20, gap=0, gap_boost=1, gap_colour='lightgrey',
+						reports=reports)
+	if 'imports' in analyses:
+		nb_imports_parse_nb(path, reports=reports)
+	if 'text-analysis' in analyses:
+		nb_text_parse_nb(path, reports=reports, report_writer=report_writer)
+	if 'alt-tags' in analyses:
+		click.echo('\nChecking image alt text for documents in file/directory: {}'.format(path))
+		_alt_tags_report(reports["links_and_images"], False, False)
+	if 'link-check' in analyses:
+		click.echo('\nChecking links in documents in file/directory: {}'.format(path))
+		click.echo("Only displaying reports for none 200-OK  links.\n")
+		link_cache = _open_link_cache(cache, cache_dir)
+		_link_check_report(reports["links_and_images"], False, False, link_cache=link_cache)
+		if link_cache is not None:
+			link_cache.close()
+	if 'check-warnings' in analyses:
+		_warnings_report(reports["warnings"], warnings_out)
+
+@cli.command()
+@click.argument('partials', nargs=-1, required=True)
+@click.option('--analysis', '-a', 'analyses', multiple=True, type=click.Choice(list(ANALYSES)),
+			  help="Analysis to run (may be repeated; default: the analyses the shards were run for).")
+@click.option('--out', '-o', default='nb_quality_review.png',  help='Chart image outfile')
+@click.option('--warnings-out', default="warnings_report.html",  help='Warnings report outfile')
+@click.option('--cache/--no-cache', default=True, help="Enable/disable the link status cache.")
+@click.option('--cache-dir', default=None, help="Link status cache directory.")
+@click.option('--format', 'report_format', default='text', type=click.Choice(['text', 'parquet']),
+			  help="Summarise the cell reports as text, or write them to a Parquet dataset.")
+@click.option('--report-out', default='nb_quality_report.parquet', help='Parquet dataset outdir')
+def merge(partials, analyses, out, warnings_out, cache, cache_dir, report_format, report_out):
+	"""Merge the partial results saved by `all --shard` runs, and run the analyses on them."""
+	from .shards import read_partial_results
+	from .nb_visualiser import collect_notebook_reports
+
+	try:
+		meta, notebook_reports = read_partial_results(partials)
+	except (ValueError, ImportError) as e:
+		raise click.ClickException(str(e))
+	available = [analysis for analysis in ANALYSES if set(ANALYSES[analysis]) <= set(meta["analyses"])]
+	unavailable = [analysis for analysis in analyses if analysis not in available]
+	if unavailable:
+		raise click.UsageError(f"The shards don't have the results needed for: {', '.join(unavailable)}")
+	analyses = analyses or meta.get("cli_analyses", available)
+	path = meta["path"]
+	click.echo('Merging partial results for file/directory: {}'.format(path))
+	report_writer = _open_report_writer(report_format, report_out) if 'text-analysis' in analyses else None
+	# The notebooks are combined in the same order as a single run, so the reports are the same
+	reports = collect_notebook_reports(notebook_reports, report_writer=report_writer)
+	_all_analyses_report(path, analyses, reports, out, warnings_out, report_writer, cache, cache_dir)
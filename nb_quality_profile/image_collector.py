@@ -0,0 +1,146 @@
+# Collect copies of the images used in a set of notebooks,
+# fetching or copying each distinct image only once
+
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+IMAGE_DIR = "grab_images"
+
+# Record of where each collected image came from, so that unchanged images needn't be collected again
+IMAGE_MANIFEST = "images.json"
+
+# Maximum number of images fetched or copied at once
+IMAGE_FETCH_CONCURRENCY = 8
+
+# Timeout for fetching each remote image, in seconds
+IMAGE_FETCH_TIMEOUT = 30
+
+
+def image_source(src, nb_dir):
+    """Resolve the src of an image in a notebook to a URL or an absolute file path.
+
+    Returns None for images that can't be collected, such as inline data and cell attachments."""
+    scheme = urlsplit(src).scheme
+    if scheme in ("http", "https"):
+        return src
+    if scheme:
+        return None
+    return str((Path(nb_dir) / src).resolve())
+
+
+def _is_remote(source):
+    return urlsplit(source).scheme in ("http", "https")
+
+
+def _image_suffix(source, content_type=None):
+    """Get the file suffix for an image, from its source or its content type."""
+    suffix = Path(urlsplit(source).path).suffix.lower()
+    if not suffix and content_type:
+        suffix = mimetypes.guess_extension(content_type.split(";")[0].strip()) or ""
+    return suffix
+
+
+def _file_hash(fn):
+    """Get the hash of a file's contents."""
+    h = hashlib.sha256()
+    with open(fn, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _store(img_dir, digest, suffix, write):
+    """Store an image under its content hash, unless an identical image is already stored.
+
+    `write(path)` writes the image to the given path."""
+    dest = img_dir / f"{digest}{suffix}"
+    if not dest.is_file():
+        # Write to a temporary file first so a partly written image is never left behind
+        fd, tmp = tempfile.mkstemp(dir=img_dir, suffix=".part")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, dest)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return dest
+
+
+def _collect_local(source, img_dir, previous):
+    """Copy a local image into the image directory."""
+    if not os.path.isfile(source):
+        return None
+    stat = os.stat(source)
+    if previous and (previous.get("mtime"), previous.get("size")) == (stat.st_mtime_ns, stat.st_size):
+        if (img_dir / previous["file"]).is_file():
+            return previous
+    # copyfile uses a zero-copy copy (e.g. sendfile) where the platform supports it
+    dest = _store(img_dir, _file_hash(source), _image_suffix(source),
+                  lambda tmp: shutil.copyfile(source, tmp))
+    return {"file": dest.name, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _collect_remote(source, img_dir, previous, timeout):
+    """Fetch a remote image into the image directory.
+
+    If the image has been fetched before, it is only downloaded again if it has changed."""
+    headers = {}
+    if previous and (img_dir / previous["file"]).is_file():
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+    try:
+        with urllib.request.urlopen(urllib.request.Request(source, headers=headers), timeout=timeout) as r:
+            data = r.read()
+            info = r.headers
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return previous
+        return None
+    except Exception:
+        return None
+
+    def write(tmp):
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+    dest = _store(img_dir, hashlib.sha256(data).hexdigest(), _image_suffix(source, info.get("Content-Type")), write)
+    return {"file": dest.name, "etag": info.get("ETag"), "last_modified": info.get("Last-Modified")}
+
+
+def collect_images(sources, img_dir=IMAGE_DIR, concurrency=IMAGE_FETCH_CONCURRENCY, timeout=IMAGE_FETCH_TIMEOUT):
+    """Collect copies of some images (URLs or absolute file paths, see `image_source()`) into a directory.
+
+    Each distinct source is only collected once, and images are stored under a hash of their
+    content, so identical images from different sources are only stored once. Local images are
+    copied and remote images are fetched concurrently.
+
+    Returns a dict of the path of each collected image, keyed by source, or None if an image couldn't be collected."""
+    img_dir = Path(img_dir)
+    img_dir.mkdir(parents=True, exist_ok=True)
+    manifest_fn = img_dir / IMAGE_MANIFEST
+    manifest = json.loads(manifest_fn.read_text()) if manifest_fn.is_file() else {}
+
+    def collect(source):
+        if _is_remote(source):
+            return _collect_remote(source, img_dir, manifest.get(source), timeout)
+        return _collect_local(source, img_dir, manifest.get(source))
+
+    sources = [source for source in dict.fromkeys(sources) if source is not None]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        entries = dict(zip(sources, executor.map(collect, sources)))
+
+    manifest.update({source: entry for source, entry in entries.items() if entry is not None})
+    manifest_fn.write_text(json.dumps(manifest, indent=1))
+    return {source: None if entry is None else img_dir / entry["file"] for source, entry in entries.items()}
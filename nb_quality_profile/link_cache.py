@@ -0,0 +1,82 @@
+# Persistent cache of link check reports, so that links that have been
+# checked recently don't need to be checked again
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from .cell_cache import default_cache_dir, IN_MEMORY
+
+LINK_CACHE_DB = "link_cache.sqlite"
+
+# How long to trust the cached report for a link that resolved OK,
+# and for one that didn't, in seconds
+LINK_OK_TTL = 7 * 24 * 60 * 60
+LINK_ERROR_TTL = 60 * 60
+
+
+class LinkCache:
+    """Cache of link reports (the redirect chain and final status of each link), keyed by URL.
+
+    Each report is stored along with the time the link was checked. A cached report is only
+    used while it is younger than `ok_ttl` seconds, if the link resolved OK, or `error_ttl`
+    seconds, if it didn't, so broken links are rechecked sooner than working ones."""
+
+    def __init__(self, cache_dir=None, ok_ttl=LINK_OK_TTL, error_ttl=LINK_ERROR_TTL):
+        self.ok_ttl = ok_ttl
+        self.error_ttl = error_ttl
+        if cache_dir == IN_MEMORY:
+            self.conn = sqlite3.connect(IN_MEMORY)
+        else:
+            cache_dir = Path(cache_dir or default_cache_dir())
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(cache_dir / LINK_CACHE_DB), timeout=30)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS links (
+                url TEXT PRIMARY KEY, report TEXT, status INTEGER, ok INTEGER, checked REAL)"""
+        )
+        self.conn.commit()
+
+    def get(self, url, now=None):
+        """Get the cached report for a link, or None if it isn't cached or the cached report is too old."""
+        now = time.time() if now is None else now
+        row = self.conn.execute("SELECT report, ok, checked FROM links WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        report, ok, checked = row
+        if now - checked >= (self.ok_ttl if ok else self.error_ttl):
+            return None
+        # JSON turns the report tuples into lists
+        return [tuple(step) for step in json.loads(report)]
+
+    def get_many(self, urls):
+        """Get a dict of the usable cached reports for some links, keyed by URL."""
+        now = time.time()
+        reports = {url: self.get(url, now) for url in urls}
+        return {url: report for url, report in reports.items() if report is not None}
+
+    def put(self, url, report, checked=None):
+        """Cache the report for a link."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO links (url, report, status, ok, checked) VALUES (?, ?, ?, ?, ?)",
+            (url, json.dumps(report), report[-1][2], bool(report[-1][0]),
+             time.time() if checked is None else checked),
+        )
+
+    def put_many(self, reports):
+        """Cache a dict of link reports, keyed by URL."""
+        checked = time.time()
+        for url, report in reports.items():
+            self.put(url, report, checked)
+        self.conn.commit()
+
+    def clear(self):
+        """Remove all the cached link reports."""
+        self.conn.execute("DELETE FROM links")
+        self.conn.commit()
+
+    def close(self):
+        """Write any changes to disk and close the cache."""
+        self.conn.commit()
+        self.conn.close()
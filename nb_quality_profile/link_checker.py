@@ -0,0 +1,154 @@
+# Check a set of links concurrently, fetching each distinct URL only once
+
+import asyncio
+from urllib.parse import urlsplit
+
+# Maximum number of requests in flight at any one time, and to any one host
+LINK_CHECK_CONCURRENCY = 32
+LINK_CHECK_HOST_CONCURRENCY = 4
+
+# Timeout for each request, in seconds
+LINK_CHECK_TIMEOUT = 10
+
+# Number of times to retry a request that fails (or gets a server error),
+# waiting LINK_CHECK_BACKOFF * 2**n seconds before the n'th retry
+LINK_CHECK_RETRIES = 2
+LINK_CHECK_BACKOFF = 0.5
+
+# Statuses that are worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+LINK_ERROR_REASON = "Error resolving URL"
+
+
+def is_web_link(url):
+    """Check whether a link is one that can be resolved over the web."""
+    return urlsplit(url).scheme in ("http", "https")
+
+
+def link_error_report(url):
+    """Get the report for a link that could not be resolved."""
+    return [(False, url, None, LINK_ERROR_REASON)]
+
+
+class _AiohttpFetcher:
+    """Resolve links with a pooled, keep-alive aiohttp session."""
+
+    def __init__(self, concurrency, host_concurrency, timeout):
+        import aiohttp
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency, limit_per_host=host_concurrency),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        )
+
+    async def fetch(self, url):
+        async with self.session.head(url, allow_redirects=True) as r:
+            return [(step.status < 400, str(step.url), step.status, step.reason) for step in [*r.history, r]]
+
+    async def close(self):
+        await self.session.close()
+
+
+class _RequestsFetcher:
+    """Resolve links with a pooled, keep-alive requests session, in worker threads."""
+
+    def __init__(self, concurrency, host_concurrency, timeout):
+        import requests
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=host_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.timeout = timeout
+
+    def _fetch(self, url):
+        r = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        return [(step.ok, step.url, step.status_code, step.reason) for step in [*r.history, r]]
+
+    async def fetch(self, url):
+        # (asyncio.to_thread() would need Python 3.9)
+        return await asyncio.get_event_loop().run_in_executor(None, self._fetch, url)
+
+    async def close(self):
+        self.session.close()
+
+
+def _fetcher(concurrency, host_concurrency, timeout):
+    """Use aiohttp if it is installed, otherwise fall back to requests."""
+    try:
+        return _AiohttpFetcher(concurrency, host_concurrency, timeout)
+    except ImportError:
+        pass
+    try:
+        return _RequestsFetcher(concurrency, host_concurrency, timeout)
+    except ImportError:
+        raise ImportError("Checking links needs requests (or aiohttp): pip install requests")
+
+
+async def _check_link(url, fetcher, limit, host_limits, host_concurrency, retries, backoff):
+    """Resolve a link, retrying with exponential backoff if it fails."""
+    if not is_web_link(url):
+        # Relative links, anchors, mailto: links etc can't be resolved
+        return link_error_report(url)
+    host_limit = host_limits.setdefault(urlsplit(url).netloc, asyncio.Semaphore(host_concurrency))
+    report = link_error_report(url)
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            # Wait for the host to be free before taking up one of the overall slots
+            async with host_limit, limit:
+                report = await fetcher.fetch(url)
+        except Exception:
+            report = link_error_report(url)
+            continue
+        if report[-1][2] not in RETRY_STATUSES:
+            break
+    return report
+
+
+async def check_links_async(urls, concurrency=LINK_CHECK_CONCURRENCY, host_concurrency=LINK_CHECK_HOST_CONCURRENCY,
+                            timeout=LINK_CHECK_TIMEOUT, retries=LINK_CHECK_RETRIES, backoff=LINK_CHECK_BACKOFF,
+                            link_cache=None):
+    """Check a set of links concurrently, and return a dict of link reports, keyed by URL.
+
+    Each distinct URL is only checked once. Each link report is a list of (ok, url, status, reason)
+    tuples, one for each step in the redirect chain; links that can't be resolved are reported as
+    [(False, url, None, "Error resolving URL")].
+
+    If a `link_cache` is provided, only links that aren't in the cache, or whose cached reports
+    are too old, are checked, and the cache is updated with the new reports."""
+    urls = list(dict.fromkeys(urls))
+    cached = link_cache.get_many(urls) if link_cache is not None else {}
+    reports = await _check_links(
+        [url for url in urls if url not in cached], concurrency, host_concurrency, timeout, retries, backoff
+    )
+    if link_cache is not None:
+        link_cache.put_many({url: report for url, report in reports.items() if is_web_link(url)})
+    reports.update(cached)
+    return {url: reports[url] for url in urls}
+
+
+async def _check_links(urls, concurrency, host_concurrency, timeout, retries, backoff):
+    """Check some distinct links concurrently, and return a dict of link reports, keyed by URL."""
+    if not urls:
+        return {}
+    fetcher = _fetcher(concurrency, host_concurrency, timeout)
+    limit = asyncio.Semaphore(concurrency)
+    host_limits = {}
+    try:
+        reports = await asyncio.gather(
+            *[_check_link(url, fetcher, limit, host_limits, host_concurrency, retries, backoff) for url in urls]
+        )
+    finally:
+        await fetcher.close()
+    return dict(zip(urls, reports))
+
+
+def check_links(urls, **kwargs):
+    """Check a set of links concurrently, and return a dict of link reports, keyed by URL.
+
+    See `check_links_async()` for the options and the link report format.
+    (If an event loop is already running, e.g. in a notebook, `await check_links_async()` instead.)"""
+    return asyncio.run(check_links_async(urls, **kwargs))
@@ -22,20 +22,19 @@
 
 # +
 import math
-import matplotlib.pyplot as plt
 import list_imports
 from io import  BytesIO
 import base64  
-import jupytext
 from .text_quality import md_readtime
 from pathlib import Path
-from .notebook_profiler import process_notebook_file
+from .notebook_profiler import process_notebook
 from pandas import concat, DataFrame
 
 def nb_vis(cell_map, img_file='', linewidth = 5, w=20, gap=None,
            gap_boost=1, gap_colour='lightgrey', retval='',
            wordless=False, minimal=False, header_gap=0.2, dpi=80, **kwargs):
     """Visualise notebook gross cell structure."""
+    import matplotlib.pyplot as plt
 
     def get_gap(cell_map):
         """Automatically set the gap value based on overall length"""
@@ -126,74 +125,285 @@ LINE_WIDTH = 160
 # The following function will find one or more notebooks on a path and generate cell maps for each of them. All the cell maps are then passed for visualisation on the same canvas.
 
 # +
-import nbformat
-import os
 import textwrap
 from glob import glob
 
-from .notebook_profiler import safe_concat
-def nb_big_parse_nb(path='', text_formats=True, raw='', path_filter=None, **kwargs):
-    """Parse one or more notebooks on a path."""
+from .notebook_profiler import (
+    concat_reports,
+    process_notebook_corpus,
+    incremental_notebook_reports,
+    FILE_STAMP,
+    NotebookContext,
+    notebook_links_and_images,
+    notebook_warnings,
+    make_html_tree,
+    _cell_outputs,
+    add_corpus_keyterms,
+    NLP_BATCH_SIZE,
+    NLP_N_PROCESS,
+    DEFAULT_NLP_PROFILE,
+    PROFILE_JOBS,
+    parallel_notebook_reports,
+    prefetch,
+)
+from .shards import shard_key, shard_notebooks, write_partial_results
 
-    def _count_screen_lines(txt, width=LINE_WIDTH):
-        """Count the number of screen lines that an overflowing text line takes up."""
-        ll = txt.split('\n')
-        _ll = []
-        for l in ll:
-            # Model screen flow: split a line if it is more than `width` characters long
-            _ll=_ll+textwrap.wrap(l, width)
-        n_screen_lines = len(_ll)
-        return n_screen_lines
+# Each report is generated by an analyser that declares the inputs it needs, such as the code cell sources, the cell outputs or the HTML rendered from the markdown. Some inputs are derived from other inputs, so when we ask for a set of reports, we work out the full set of inputs they need and only compute those, once per notebook, before running the analysers for the requested reports. In particular, the `spacy` input, which requires the language model to be loaded and the markdown to be parsed, is only used by the `big_report`, so just charting a set of notebooks never touches `spacy` at all.
 
-    def _nb_big_parse_nb(fn=None, text_formats=True, raw='', **kwargs):
-        """Parse a notebook and generate the nb_vis cell map for it."""
+# +
+def _count_screen_lines(txt, width=LINE_WIDTH):
+    """Count the number of screen lines that an overflowing text line takes up."""
+    ll = txt.split('\n')
+    _ll = []
+    for l in ll:
+        # Model screen flow: split a line if it is more than `width` characters long
+        _ll=_ll+textwrap.wrap(l, width)
+    n_screen_lines = len(_ll)
+    return n_screen_lines
+
+def _input_code(ctx):
+    """Get the lines of code in the code cells of a notebook, without any IPython magics or shell commands."""
+    # AST parser breaks on ipython magic, etc
+    return [c for cell in ctx.get_input('cells') if cell['cell_type']=='code'
+            for c in cell['source'].split('\n') if not c.startswith(('!','%'))]
+
+def _input_markdown(ctx):
+    """Get the sources of the markdown cells in a notebook."""
+    return [cell['source'] for cell in ctx.get_input('cells') if cell['cell_type']=='markdown']
+
+def _input_html(ctx):
+    """Generate the HTML tree for all the markdown in a notebook."""
+    return make_html_tree('\n\n'.join(ctx.get_input('markdown')))
+
+# The inputs the analysers work from: for each input, the inputs it is derived from
+# and how to compute it for a parsed notebook. Each input is listed after the inputs it is derived from.
+# The `spacy` input is computed across the whole corpus rather than a notebook at a time,
+# so that spacy's batches stay full (see `process_notebook_corpus()`).
+NB_INPUTS = {
+    'cells': ([], lambda ctx: ctx.cells),
+    'code': (['cells'], _input_code),
+    'markdown': (['cells'], _input_markdown),
+    'outputs': (['cells'], _cell_outputs),
+    'html': (['markdown'], _input_html),
+    'spacy': (['markdown'], None),
+}
+
+def _nb_cell_map(ctx, **kwargs):
+    """Generate the nb_vis cell map for a notebook."""
+    return [(_count_screen_lines(cell['source']), VIS_COLOUR_MAP[cell['cell_type']])
+            for cell in ctx.get_input('cells') if cell['cell_type'] in VIS_COLOUR_MAP]
+
+def _nb_imports(ctx, **kwargs):
+    """Get the packages imported by the code cells in a notebook."""
+    imports = []
+    for code in ctx.get_input('code'):
+        try:
+            imports = imports + list_imports.parse(code)
+        except:
+            pass
+    return list(set(imports))
+
+def _nb_text_report(ctx, **kwargs):
+    """Get the reading time for the markdown cells in a notebook."""
+    text_report = {'reading_time':0}
+    for md in ctx.get_input('markdown'):
+        text_report['reading_time'] += md_readtime(md, rounding_override=True, **kwargs)
+    if 'rounded_minutes' in kwargs and kwargs['rounded_minutes']:
+        text_report['reading_time'] =  math.ceil(text_report['reading_time']/60)
+    return text_report
+
+def _nb_label(ctx):
+    """Get the label used for a notebook in the links and warnings reports."""
+    return str(ctx.fn) if ctx.fn else "RAW"
+
+def _nb_links_and_images(ctx, **kwargs):
+    """Get the links and images from the markdown cells in a notebook."""
+    return notebook_links_and_images(ctx, _nb_label(ctx))
+
+def _nb_warnings(ctx, **kwargs):
+    """Get the warnings from the code cell outputs in a notebook."""
+    return notebook_warnings(ctx, ctx.fn if ctx.fn else "RAW")
+
+# The report each analyser generates, the inputs it needs, and the analyser;
+# the big report is generated along with the `spacy` input, across the whole corpus
+NB_ANALYSERS = {
+    'cell_map': (['cells'], _nb_cell_map),
+    'imports': (['code'], _nb_imports),
+    'text_report': (['markdown'], _nb_text_report),
+    'big_report': (['spacy'], None),
+    'links_and_images': (['html'], _nb_links_and_images),
+    'warnings': (['outputs'], _nb_warnings),
+}
+
+DEFAULT_ANALYSES = ['cell_map', 'imports', 'text_report', 'big_report']
+
+# The cell report columns needed to find the corpus key terms
+KEYTERM_COLUMNS = ['filename', 'keyterm_text', 'keyterms']
+
+def required_inputs(analyses):
+    """Get all the inputs needed to generate a set of reports."""
+    required = set()
+    pending = [i for analysis in analyses for i in NB_ANALYSERS[analysis][0]]
+    while pending:
+        _input = pending.pop()
+        if _input not in required:
+            required.add(_input)
+            pending.extend(NB_INPUTS[_input][0])
+    return required
 
-        cell_map = []
-        imports = []
-        text_report = {'reading_time':0}
 
-        if raw:
-            nb = raw
-        elif fn:
-            fmts = ['.ipynb']
-            if text_formats:
-                fmts = fmts + ['.md', '.Rmd', '.py']
-            _fn, fn_ext = os.path.splitext(fn)
+# -
 
-            if fn_ext not in fmts or not os.path.isfile(fn):
+def _run_analysers(ctx, analyses, **kwargs):
+    """Compute the inputs needed for the requested reports, other than the big report,
+    and then generate those reports for a parsed notebook."""
+    required = required_inputs(analyses)
+    for _input, (_, compute) in NB_INPUTS.items():
+        if _input in required and compute is not None:
+            ctx.artefact(_input, compute)
+    reports = {}
+    for analysis in analyses:
+        _, analyser = NB_ANALYSERS[analysis]
+        if analyser is not None:
+            reports[analysis] = analyser(ctx, **kwargs)
+    return reports
+
+def _big_parse_notebook_files(fns, text_formats=True, analyses=DEFAULT_ANALYSES,
+                              batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS,
+                              nlp_profile=DEFAULT_NLP_PROFILE, cell_cache=None, text_store=None, **kwargs):
+    """Generate the requested reports for each of a list of notebook files."""
+    # Each notebook is only read and parsed once, and the parsed notebook is shared by all the reports
+    contexts = {}
+    def _notebooks():
+        # The notebooks are read ahead in a pool of threads while earlier ones are being profiled
+        for fn, ctx in prefetch(fns, lambda fn: NotebookContext.from_file(fn, text_formats)):
+            contexts[fn] = ctx
+            yield fn, ctx
+    if 'spacy' in required_inputs(analyses):
+        # Stream the markdown cells from all the notebooks through a single spacy pipe
+        # so that spacy's batches stay full across notebook boundaries
+        big_reports = process_notebook_corpus(_notebooks(), batch_size=batch_size, n_process=n_process,
+                                              nlp_profile=nlp_profile, cell_cache=cell_cache,
+                                              text_store=text_store)
+    else:
+        big_reports = ((fn, None) for fn, _ in _notebooks())
+    for fn, big_report_df in big_reports:
+        # Profile that notebook...
+        ctx = contexts.pop(fn)
+        reports = _run_analysers(ctx, analyses, **kwargs)
+        if big_report_df is not None:
+            reports["big_report"] = big_report_df
+        reports[FILE_STAMP] = ctx.stamp
+        yield reports
+
+def collect_notebook_reports(notebook_reports, report_writer=None, keep_records=True):
+    """Combine the reports generated for each of a set of notebooks, given as (fn, reports) pairs,
+    into reports for the whole set.
+    
+    The cell reports are written to the `report_writer`, if one is provided, rather than
+    being collected into `big_report` and `big_report_df`.
+    If `keep_records` is False, the cell reports are only collected into `big_report_df`,
+    and not also copied into per notebook lists of records in `big_report`."""
+    nb_multidir_cell_map = {}
+    nb_multidir_imports = {}
+    nb_multidir_text_report = {}
+    nb_multidir_big_report = {}
+    nb_multidir_links_and_images = []
+    nb_multidir_warnings = []
+    big_report_dfs = []
+    for fn, reports in notebook_reports:
+        cell_map = reports.get('cell_map')
+        imports = reports.get('imports')
+        text_report = reports.get('text_report')
+        big_report = None
+        if 'big_report' in reports:
+            big_report_df = reports['big_report']
+            if report_writer is None and keep_records:
+                big_report = big_report_df.to_dict('records')
+            big_report_df["path"] = str(Path(fn).parent)
+            big_report_df["name"] = Path(fn).name
+            if report_writer is not None:
+                report_writer.write_notebook(big_report_df)
+                # Only hang on to what we need to find the corpus key terms
+                big_report_df = big_report_df[[c for c in KEYTERM_COLUMNS if c in big_report_df]]
+            big_report_dfs.append(big_report_df)
+        if cell_map:
+            nb_multidir_cell_map[fn] = cell_map
+        if imports:
+            nb_multidir_imports[fn] = imports
+        if text_report:
+            nb_multidir_text_report[fn] = text_report
+        if big_report:
+            nb_multidir_big_report[fn] = big_report
+        if 'links_and_images' in reports:
+            nb_multidir_links_and_images.append(reports['links_and_images'])
+        if 'warnings' in reports:
+            nb_multidir_warnings.extend(reports['warnings'])
+    very_big_report_df = concat_reports(big_report_dfs)
+    # Key terms are extracted relative to the whole corpus once all the notebooks are processed
+    nb_multidir_keyterms = add_corpus_keyterms(very_big_report_df)
+    if report_writer is not None:
+        report_writer.close(nb_multidir_keyterms)
+    return {
+        "cell_map": nb_multidir_cell_map,
+        "imports": nb_multidir_imports,
+        "text_report": nb_multidir_text_report,
+        "big_report": nb_multidir_big_report,
+        "big_report_df": very_big_report_df,
+        "keyterms": nb_multidir_keyterms,
+        "links_and_images": nb_multidir_links_and_images,
+        "warnings": nb_multidir_warnings,
+    }
+
+def nb_big_parse_nb(path='', text_formats=True, raw='', path_filter=None,
+                    batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS,
+                    nlp_profile=DEFAULT_NLP_PROFILE, cell_cache=None,
+                    analyses=DEFAULT_ANALYSES, report_writer=None, text_store=None, jobs=PROFILE_JOBS,
+                    shard=None, partial_out=None, partial_meta=None, **kwargs):
+    """Parse one or more notebooks on a path.
+    
+    `analyses` lists the reports to generate (see `NB_ANALYSERS`);
+    only the work needed for those reports is done.
+    
+    If a `report_writer` (e.g. a `ParquetReportWriter`) is provided, the cell reports are written
+    to it a notebook at a time rather than being collected into `big_report` and `big_report_df`.
+    If a `text_store` is provided, the cell text is kept in the `TextStore` and the cell reports
+    just refer to it; to save memory, the cell reports are then only returned as `big_report_df`.
+    If `jobs` is more than 1, the notebooks on a path are profiled by that many worker processes.
+    If a `shard` is given, as an (i, N) tuple, only the notebooks in the i'th of N shards are profiled,
+    and if a `partial_out` file is also given, the partial results for the shard are saved to it
+    so that they can be merged with the other shards (see `shards.read_partial_results()`),
+    along with any `partial_meta` dict."""
+
+    use_spacy = 'spacy' in required_inputs(analyses)
+
+    def _nb_big_parse_nb(fn=None, text_formats=True, raw='', **kwargs):
+        """Parse a notebook and generate the requested reports for it.
+        
+        `fn` may be a filename or an already parsed `NotebookContext`."""
+
+        if isinstance(fn, NotebookContext):
+            ctx = fn
+            fn = ctx.fn
+        elif raw:
+            ctx = NotebookContext(raw)
+        elif fn:
+            ctx = NotebookContext.from_file(fn, text_formats)
+            if ctx.nb is None:
                 # Better to return this as empty and check downstream?
                 print(f"fn {fn} is not an readable as a notebook file.")
                 return { 'cell_map':{}, 'imports':{}, 'text_report':{}}
-
-            if fn_ext=='.ipynb':
-                with open(fn,'r') as f:
-                    nb = nbformat.reads(f.read(), as_version=4)
-            else:
-                nb = jupytext.read(fn)
         else:
             print(f"No raw text or filename?")
             return { 'cell_map':{}, 'imports':{}, 'text_report':{}}
 
-        for cell in nb.cells:
-            if cell['cell_type'] not in VIS_COLOUR_MAP:
-                continue
-            cell_map.append((_count_screen_lines(cell['source']), VIS_COLOUR_MAP[cell['cell_type']]))
-            if cell['cell_type']=='code':
-                # AST parser breaks on ipython magic, etc
-                clean_code = [c for c in cell['source'].split('\n') if not c.startswith(('!','%'))]
-                for code in clean_code:
-                    try:
-                        imports = imports + list_imports.parse(code)
-                    except:
-                        pass
-            elif cell['cell_type']=='markdown':
-                text_report['reading_time'] += md_readtime(cell['source'], rounding_override=True, **kwargs)
-        if 'rounded_minutes' in kwargs and kwargs['rounded_minutes']:
-            if 'reading_time' in text_report:
-                text_report['reading_time'] =  math.ceil(text_report['reading_time']/60)
-        big_report = process_notebook_file(fn)
-        return { 'cell_map':cell_map, 'imports':list(set(imports)),
-                 'text_report':text_report, "big_report":big_report }
+        reports = _run_analysers(ctx, analyses, **kwargs)
+        if use_spacy:
+            # The big report is generated from the same parsed notebook
+            reports["big_report"] = process_notebook(ctx, fn=ctx.fn, batch_size=batch_size,
+                                                     n_process=n_process, nlp_profile=nlp_profile,
+                                                     cell_cache=cell_cache, text_store=text_store)
+        return reports
 
     def _dir_walker(path='.', exclude = 'default', text_formats=True):
         """Profile all the notebooks in a specific directory, list of directories, or individual files."""
@@ -205,12 +415,6 @@ def nb_big_parse_nb(path='', text_formats=True, raw='', path_filter=None, **kwar
             exclude_paths = exclude
             exclude_dir = []
 
-        nb_multidir_cell_map = {}
-        nb_multidir_imports = {}
-        nb_multidir_text_report = {}
-        nb_multidir_big_report = {}
-        very_big_report_df = DataFrame()
-
         # Ensure path is a list to handle single paths and lists uniformly
         if isinstance(path, str):
             paths = [Path(p) for p in glob(path)]
@@ -233,39 +437,41 @@ def nb_big_parse_nb(path='', text_formats=True, raw='', path_filter=None, **kwar
                     files_to_process.append(p)
 
         # Now `files_to_process` contains all relevant files to process
-        for fn in files_to_process:
-            # Start walking...
-            if not set(exclude_paths).intersection(set(fn.parts)):
-                # Profile that directory...
-                reports = _nb_big_parse_nb(fn, text_formats, **kwargs )
-                cell_map = reports['cell_map']
-                imports = reports['imports']
-                text_report = reports['text_report']
-                big_report_df = reports["big_report"]
-                big_report=big_report_df.to_dict('records')
-                big_report_df["path"] = str(Path(fn).parent)
-                big_report_df["name"] = Path(fn).name
-                if cell_map:
-                    nb_multidir_cell_map = {**nb_multidir_cell_map, fn: cell_map}
-                if imports:
-                    nb_multidir_imports = {**nb_multidir_imports, fn: imports}
-                if text_report:
-                    nb_multidir_text_report = {**nb_multidir_text_report, fn: text_report}
-                if big_report:
-                    nb_multidir_big_report = {**nb_multidir_big_report,  fn: big_report}
-                very_big_report_df = safe_concat(
-                        [very_big_report_df, big_report_df]
-                    )
-        return {
-            "cell_map": nb_multidir_cell_map,
-            "imports": nb_multidir_imports,
-            "text_report": nb_multidir_text_report,
-            "big_report": nb_multidir_big_report,
-            "big_report_df": very_big_report_df,
-        }
-
-    # Also: we need to be able to switch on and off which reports are run
-    # Need to think about handling this properly e.g. in context of plugins
+        files_to_process = [fn for fn in files_to_process
+                            if not set(exclude_paths).intersection(set(fn.parts))]
+        def _process(fns):
+            """Generate the reports for a list of notebook files."""
+            if jobs > 1:
+                return parallel_notebook_reports(fns, _big_parse_notebook_files, jobs=jobs,
+                                                 nlp_profile=nlp_profile, load_nlp=use_spacy,
+                                                 text_store=text_store, text_formats=text_formats,
+                                                 analyses=analyses, batch_size=batch_size,
+                                                 n_process=n_process, **kwargs)
+            return _big_parse_notebook_files(fns, text_formats=text_formats, analyses=analyses,
+                                             batch_size=batch_size, n_process=n_process, nlp_profile=nlp_profile,
+                                             cell_cache=cell_cache, text_store=text_store, **kwargs)
+
+        if cell_cache is not None:
+            # Forget about any notebooks that have been deleted
+            cell_cache.prune_files([p for p in paths if p.is_dir()], files_to_process)
+        # The stored reports also depend on the reports requested and the reading time settings
+        context = f"nb_big_parse_nb:{text_formats}:{sorted(analyses)}:{sorted(kwargs.items())}"
+        if shard is not None:
+            # Only profile this shard's notebooks, remembering where each comes in the full list of notebooks
+            notebook_index = {fn: i for i, fn in enumerate(files_to_process)}
+            files_to_process = shard_notebooks(files_to_process, paths, shard)
+        notebook_reports = incremental_notebook_reports(files_to_process, _process, cell_cache=cell_cache,
+                                                        nlp_profile=nlp_profile, context=context,
+                                                        text_store=text_store)
+        if shard is not None and partial_out:
+            notebook_reports = list(notebook_reports)
+            write_partial_results(partial_out, [(notebook_index[fn], fn, reports) for fn, reports in notebook_reports],
+                                  shard=shard, notebooks=[shard_key(fn, paths) for fn in notebook_index],
+                                  path=path, analyses=sorted(analyses), context=context, **(partial_meta or {}))
+        return collect_notebook_reports(notebook_reports, report_writer=report_writer,
+                                        keep_records=text_store is None)
+
+    # Which reports are run is controlled by `analyses` (see `NB_ANALYSERS` above)
     if not raw and glob(path):
         reports = _dir_walker(path, text_formats=text_formats)
         cell_map = reports['cell_map']
@@ -273,41 +479,57 @@ def nb_big_parse_nb(path='', text_formats=True, raw='', path_filter=None, **kwar
         text_report = reports['text_report']
         big_report = reports["big_report"]
         big_report_df = reports["big_report_df"]
+        keyterms = reports["keyterms"]
+        links_and_images = reports["links_and_images"]
+        _warnings = reports["warnings"]
     else:
         reports =  _nb_big_parse_nb(path, text_formats, raw=raw, **kwargs)
 
-        cell_map = {path: reports['cell_map']}
-        imports = {path: reports['imports']}
-        text_report = {path: reports['text_report']}
-        big_report = reports["big_report"]
-        big_report_df = reports["big_report_df"]
+        cell_map = {path: reports.get('cell_map', [])}
+        imports = {path: reports.get('imports', [])}
+        text_report = {path: reports.get('text_report', {})}
+        big_report_df = reports.get("big_report", DataFrame())
+        keyterms = add_corpus_keyterms(big_report_df)
+        big_report = {path: big_report_df.to_dict('records')} if text_store is None else {}
+        if report_writer is not None:
+            report_writer.write_notebook(big_report_df.assign(path=str(Path(path).parent), name=Path(path).name))
+            report_writer.close(keyterms)
+        links_and_images = [reports['links_and_images']] if 'links_and_images' in reports else []
+        _warnings = reports.get('warnings', [])
     return {"cell_map": cell_map,
             "imports": imports,
             "text_report": text_report,
             "big_report": big_report,
-            "big_report_df": big_report_df}
-
-
-def nb_vis_parse_nb(path='.', img_file='', linewidth = 5, w=20, text_formats=True, retval='', raw='', path_filter=None, **kwargs):
-    """Do a big parse and then chart the result."""
-    reports = nb_big_parse_nb(
-        path, text_formats, raw=raw, path_filter=path_filter, **kwargs
-    )
+            "big_report_df": big_report_df,
+            "keyterms": keyterms,
+            "links_and_images": links_and_images,
+            "warnings": _warnings}
+
+
+def nb_vis_parse_nb(path='.', img_file='', linewidth = 5, w=20, text_formats=True, retval='', raw='', path_filter=None,
+                    reports=None, **kwargs):
+    """Do a big parse, or use the `reports` from an earlier one, and then chart the result."""
+    if reports is None:
+        reports = nb_big_parse_nb(
+            path, text_formats, raw=raw, path_filter=path_filter, analyses=['cell_map'], **kwargs
+        )
     cell_map = reports["cell_map"]
     response = nb_vis(cell_map, img_file, linewidth, w, retval=retval, **kwargs)
     if retval:
         return response
 
 def nb_imports_parse_nb(path='.', text_formats=True,
-                        raw='', installed=True, verbose=True):
-    """Do a big parse and then print the result."""
+                        raw='', installed=True, verbose=True, reports=None):
+    """Do a big parse, or use the `reports` from an earlier one, and then print the result."""
+    import matplotlib.pyplot as plt
     from isort import place_module
     import pkg_resources
 
     # Returns: STDLIB, THIRDPARTY
     # For python 3.10, we could use: sys.stdlib_module_names
 
-    reports = nb_big_parse_nb(path, text_formats, raw=raw)
+    if reports is None:
+        reports = nb_big_parse_nb(path, text_formats, raw=raw, analyses=['imports'])
     imports = reports["imports"]
     all_packages = []
     third_party = []
@@ -381,11 +603,22 @@ from .notebook_profiler import (
     multi_level_reporter,
 )
 
-def nb_text_parse_nb(path='.', text_formats=True, reading_rate=100, rounded_minutes=False, raw=''):
-    """Parse markdown text in notebook(s)."""
-    reports = nb_big_parse_nb(path, text_formats, reading_rate=reading_rate, rounded_minutes=rounded_minutes, raw=raw)
+def nb_text_parse_nb(path='.', text_formats=True, reading_rate=100, rounded_minutes=False, raw='',
+                     nlp_profile=DEFAULT_NLP_PROFILE, cell_cache=None, reports=None, report_writer=None,
+                     text_store=None, jobs=PROFILE_JOBS):
+    """Parse markdown text in notebook(s), or use the `reports` from an earlier parse.
+    
+    If a `report_writer` is provided, the cell reports are written to it instead of being summarised."""
+    if reports is None:
+        reports = nb_big_parse_nb(path, text_formats, reading_rate=reading_rate, rounded_minutes=rounded_minutes,
+                                  raw=raw, nlp_profile=nlp_profile, cell_cache=cell_cache,
+                                  analyses=['imports', 'big_report'], report_writer=report_writer,
+                                  text_store=text_store, jobs=jobs)
     # print("\nTEXT REPORT\n",reports['text_report'])
     print("\n\nIMPORTS REPORT\n",reports["imports"])
+    if report_writer is not None:
+        print(f"\n\nCell reports written to: {report_writer.out_dir}")
+        return
     # print("\n\BIG REPORT\n", reports["big_report"], "\n\n")
 
     # print(reporter(reports["big_report_df"], report_template_full))
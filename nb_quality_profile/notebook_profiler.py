@@ -6,7 +6,7 @@
 #       extension: .py
 #       format_name: light
 #       format_version: '1.5'
-#       jupytext_version: 1.16.4
+#       jupytext_version: 1.19.6
 #   kernelspec:
 #     display_name: Python 3 (ipykernel)
 #     language: python
@@ -86,6 +86,18 @@ LINE_WIDTH = 160 #character width of a line of markdown text; used to calculate
 CODE_CELL_REVIEW_TIME = 5 # nominal time in seconds to run each code cell / review each code cell output
 
 CELL_SKIP_TIME = 1 # nominal time in seconds to move from one cell to the next
+
+NLP_BATCH_SIZE = 64 # number of markdown cells passed to spacy at a time by nlp.pipe
+
+NLP_N_PROCESS = 1 # number of processes nlp.pipe uses to parse markdown cells
+
+PROFILE_JOBS = 1 # number of worker processes used to profile the notebooks in a directory
+
+READ_WORKERS = 4 # number of threads used to read notebooks ahead of profiling them
+
+READ_AHEAD = 16 # maximum number of notebooks read ahead of the one being profiled
+
+FILE_STAMP = 'file_stamp' # reports key for the stamp of the notebook file the reports were generated from
 # -
 
 # ## Open Notebook
@@ -129,10 +141,12 @@ import nbformat
 # https://github.com/alanhamlett/readtime
 # #%pip install readtime
 
-import readtime
+# readtime is imported where it is used, to keep the command line tools quick to start
 import math
 
 # + tags=["active-ipynb"]
+# import readtime
+#
 # rt = readtime.of_markdown(txt, wpm=READING_RATE).delta.total_seconds()
 #
 # #Round up on the conversion of estimated reading time in seonds, to minutes...
@@ -144,26 +158,98 @@ import math
 # +
 # #%pip install --upgrade spacy pandas scikit-lean
 
+# Loading a `spacy` language model is slow, and many of the reports (chart, imports, warnings, etc.) don't need it at all. So rather than loading the model when the package is imported, we load it on demand the first time it is needed and then reuse it for the rest of the process.
+#
+# We also only load the parts of the model pipeline that the metrics we are generating actually need.
+
 # +
 # #%pip install spacy
-import spacy
 
 # Check we have the small English model at least
 SPACY_LANG_MODEL = 'en_core_web_sm'
 
-try:
-    import en_core_web_sm
-except:
-    import spacy.cli
-    spacy.cli.download(SPACY_LANG_MODEL)
+# The components that make up the `en_core_web_sm` pipeline
+NLP_PIPELINE_COMPONENTS = ['tok2vec', 'tagger', 'parser', 'senter', 'attribute_ruler', 'lemmatizer', 'ner']
+# -
+
+# Not every metric needs every component in the `spacy` pipeline. For example, the text statistics only need tokens, part of speech tags and sentence boundaries; only the key term extractor needs lemmas; and none of the metrics use named entities. Each metric declares the document features it relies on, and each feature declares the pipeline components that provide it. Sentence boundaries can come from the dependency parser or from the lighter weight (and faster, but slightly less accurate) statistical sentence recogniser, `senter`.
+
+# +
+# The document features used by each of the text metrics
+NLP_METRIC_FEATURES = {
+    'text_stats': ['pos', 'sents'], # text_stats_summary() and sentence_lengths()
+    'acronyms': ['sents'], # extract_acronyms()
+    'keyterms': ['lemma', 'noun_chunks'], # extract_keyterms()
+}
+
+# The pipeline components needed to provide each document feature;
+# the sentence boundary component is set by the profile
+NLP_FEATURE_COMPONENTS = {
+    'pos': ['tok2vec', 'tagger', 'attribute_ruler'],
+    'sents': ['tok2vec'],
+    'lemma': ['tok2vec', 'tagger', 'attribute_ruler', 'lemmatizer'],
+    'noun_chunks': ['tok2vec', 'tagger', 'attribute_ruler', 'parser'],
+    'ents': ['ner'],
+}
+
+# Named pipeline profiles: the metrics to support and where sentence boundaries come from
+NLP_PROFILES = {
+    # Counts, readability and acronyms, with sentences from the sentence recogniser rather than the parser
+    'minimal': {'metrics': ['text_stats', 'acronyms'], 'sents': 'senter'},
+    # Counts, readability and acronyms, with sentences from the parser
+    'readability': {'metrics': ['text_stats', 'acronyms'], 'sents': 'parser'},
+    # All the metrics, and the full pipeline
+    'full': {'metrics': ['text_stats', 'acronyms', 'keyterms'], 'sents': 'parser', 'features': ['ents']},
+}
+
+DEFAULT_NLP_PROFILE = 'readability'
+
+def nlp_profile_components(profile=DEFAULT_NLP_PROFILE):
+    """Get the set of pipeline components required by a named pipeline profile."""
+    _profile = NLP_PROFILES[profile]
+    features = set(_profile.get('features', []))
+    for metric in _profile['metrics']:
+        features.update(NLP_METRIC_FEATURES[metric])
+    components = set()
+    for feature in features:
+        components.update(NLP_FEATURE_COMPONENTS[feature])
+    if 'sents' in features:
+        components.add(_profile['sents'])
+    return components
+
+_NLP_MODELS = {}
+
+def get_nlp(profile=DEFAULT_NLP_PROFILE, model=SPACY_LANG_MODEL):
+    """Get a spacy language model for a pipeline profile, loading (and if necessary downloading) it on first use."""
+    if (model, profile) not in _NLP_MODELS:
+        import spacy
+        components = nlp_profile_components(profile)
+        # Excluded components aren't loaded at all
+        exclude = [c for c in NLP_PIPELINE_COMPONENTS if c not in components]
+        try:
+            nlp = spacy.load(model, exclude=exclude)
+        except OSError:
+            import spacy.cli
+            spacy.cli.download(model)
+            nlp = spacy.load(model, exclude=exclude)
+        # The sentence recogniser is disabled by default
+        if 'senter' in components and 'senter' in nlp.disabled:
+            nlp.enable_pipe('senter')
+        _NLP_MODELS[(model, profile)] = nlp
+    return _NLP_MODELS[(model, profile)]
+
+def __getattr__(name):
+    # Preserve access to the module level `nlp` model without loading it at import time
+    if name == 'nlp':
+        return get_nlp()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Load a model that a text is parsed against
-nlp = spacy.load(SPACY_LANG_MODEL)
 # -
 
 # To call on `spacy`, we need to create tokenised document representation of the text (conveniently, the original text version is also stored as part of the object).
 
 # + run_control={"marked": false} tags=["active-ipynb"]
+# nlp = get_nlp()
 # doc = nlp(txt)
 # -
 # One way of using readability measures would be to set reading rates dynamically for each markdown cell based on calculated readability scores.
@@ -209,7 +295,8 @@ from .text_stats import text_stats_summary
 # Also pull out notable features in a text, such as acronyms and key terms, which may be useful as part of a notebook summary.
 
 # Extract acronyms and keyterms
-from .text_stats import extract_acronyms, extract_keyterms
+from .text_stats import extract_acronyms, extract_keyterms, merge_acronyms
+from .text_stats import keyterm_text, fit_keyterms, top_keyterms
 
 # + tags=["active-ipynb"]
 # extract_acronyms(doc)
@@ -354,10 +441,11 @@ def _report_md_features(txt):
 # import excode
 
 import io
-from pytest_codeblocks import extract_from_buffer
 
 
 # + tags=["active-ipynb"]
+# from pytest_codeblocks import extract_from_buffer
+#
 # #excode seems to expect a file buffer...
 # extract_from_buffer(io.StringIO(mc))
 # -
@@ -477,6 +565,7 @@ import math
 
 def process_extras(doc):
     """Generate a dict containing additional metrics."""
+    import readtime
 
     n_headers, n_paras, n_screen_lines, n_code_blocks, n_code = _report_md_features(doc.text)
     (n_total_code_lines, n_code_lines, n_blank_code_lines, n_single_line_comment_code_lines) = n_code
@@ -501,8 +590,13 @@ def process_extras(doc):
         # The following are both listy, so we need to handle them when we move to a dataframe
         # TO DO  - sklearn numpy issue?
         "acronyms": extract_acronyms(doc),
+        # Key terms only make sense relative to a corpus,
+        # so they are added once all the notebooks have been processed (see `add_corpus_keyterms()`)
         "keyterms": {}# extract_keyterms(doc, n=10),
     }
+    # Keep the lemmatised text for the corpus level key term extraction if the pipeline provides lemmas
+    if doc.has_annotation("LEMMA"):
+        extras["keyterm_text"] = keyterm_text(doc)
     return extras
 
 
@@ -529,7 +623,7 @@ def process_extras(doc):
 #
 # Let's start with a report that munges the all the markdown text together and report on that...
 
-def process_notebook_full_md(nb):
+def process_notebook_full_md(nb, nlp_profile=DEFAULT_NLP_PROFILE):
     """Given a notebook, return all the markdown cell content as one string,
         and all the code cell content as another string."""
     
@@ -541,7 +635,7 @@ def process_notebook_full_md(nb):
         elif cell['cell_type']=='code':
             code.append( cell['source'])
 
-    doc = nlp('\n\n'.join(txt))
+    doc = get_nlp(nlp_profile)('\n\n'.join(txt))
     code = '\n\n'.join(code)
     
     return doc, code
@@ -559,11 +653,15 @@ def process_notebook_full_md(nb):
 # +
 import pandas as pd
 
-def process_notebook_md_doc(doc):
+def md_doc_record(doc):
+    """Generate the report for a markdown doc as a dict."""
     counts, readability = text_stats_summary(doc)
-    return pd.DataFrame([{'text':doc.text,
-                          **counts, **readability,
-                          **process_extras(doc)}])
+    return {'text':doc.text,
+            **counts, **readability,
+            **process_extras(doc)}
+
+def process_notebook_md_doc(doc):
+    return pd.DataFrame([md_doc_record(doc)])
 
 
 # -
@@ -586,6 +684,7 @@ import markdown
 from lxml import etree
 from pathlib import Path
 from nbformat.notebooknode import NotebookNode
+from .cell_cache import source_hash, read_file
 
 def make_html_tree(md):
     """Generate etree HTML structure from markdown text."""
@@ -613,6 +712,57 @@ def get_links(html_tree):
 
     return links
 
+class NotebookContext:
+    """A notebook that is read and parsed once, and then shared by all the analyses run over it."""
+
+    def __init__(self, nb, fn='', stamp=None):
+        self.nb = nb
+        self.fn = fn
+        # The (modification time, size, content hash) of the file the notebook was read from
+        self.stamp = stamp
+        self._artefacts = {}
+
+    @classmethod
+    def from_file(cls, fn, text_formats=True):
+        """Read a notebook file. The notebook is None if the file isn't readable as a notebook."""
+        fmts = ['.ipynb']
+        if text_formats:
+            fmts = fmts + ['.md', '.Rmd', '.py']
+        path = Path(fn)
+        if path.suffix not in fmts or not path.is_file():
+            return cls(None, fn)
+        # Parse the bytes we stamped, so the stamp describes exactly what was profiled
+        data, stamp = read_file(path)
+        text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8').read()
+        if path.suffix == '.ipynb':
+            nb = nbformat.reads(text, as_version=4)
+        else:
+            import jupytext
+            nb = jupytext.reads(text, fmt={'extension': path.suffix})
+        return cls(nb, fn, stamp)
+
+    @property
+    def cells(self):
+        """The notebook cells."""
+        return [] if self.nb is None else self.nb.cells
+
+    @property
+    def cell_hashes(self):
+        """Hashes of the cell sources, in cell order."""
+        return self.artefact('cell_hashes', lambda ctx: [source_hash(cell['source']) for cell in ctx.cells])
+
+    def artefact(self, name, compute):
+        """Get a shared artefact, computing it with `compute(ctx)` the first time it is asked for."""
+        if name not in self._artefacts:
+            self._artefacts[name] = compute(self)
+        return self._artefacts[name]
+
+    def get_input(self, name):
+        """Get an artefact that must already have been computed, e.g. an analyser input (see `nb_visualiser.NB_INPUTS`)."""
+        if name not in self._artefacts:
+            raise KeyError(f"The {name} input hasn't been computed: is it missing from the analyser's declared inputs?")
+        return self._artefacts[name]
+
 def get_nb(nb, display_path=True):
     """Get notebook."""
     def _read_as_notebook(nb):
@@ -628,9 +778,33 @@ def get_nb(nb, display_path=True):
             nb = None
         return nb
 
+    if isinstance(nb, NotebookContext):
+        return nb.nb
     nb = nb if isinstance(nb, NotebookNode) else _read_as_notebook(nb)
     return nb
 
+def _markdown_html(ctx):
+    """Generate the HTML tree for all the markdown in a notebook."""
+    # We only need the markdown text here, so there's no need to run it through spacy
+    md = '\n\n'.join(cell['source'] for cell in ctx.cells if cell['cell_type']=='markdown')
+    return make_html_tree(md)
+
+def _cell_outputs(ctx):
+    """Get the (index, cell) pairs for the cells in a notebook that have outputs."""
+    return [(i, cell) for i, cell in enumerate(ctx.cells) if "outputs" in cell]
+
+def notebook_links_and_images(ctx, label=''):
+    """Extract links and images from a parsed notebook (`NotebookContext`)."""
+    html_ = ctx.artefact('html', _markdown_html)
+    if html_ is None:
+        print(f"Error parsing HTML tree for {label}")
+        return {"notebook": label, "images": [], "links": []}
+
+    return {"notebook": label,
+            "images": get_images(html_),
+            "links": get_links(html_)
+           }
+
 def nb_md_links_and_images(nb):
     """Extract links and images from notebook."""
     def _nb_report(_nb):
@@ -639,18 +813,8 @@ def nb_md_links_and_images(nb):
         if not nb:
             return {"notebook": None, "images": [], "links": []}
 
-        full_doc, full_code = process_notebook_full_md(nb)
-        html_ = make_html_tree(full_doc.text)
-        if html_ is None:
-            print(f"Error parsing HTML tree for {_nb}")
-            return {"notebook": "RAW" if isinstance(_nb, NotebookNode) else str(_nb),
-                "images": [],
-                "links": []}
-
-        return {"notebook": "RAW" if isinstance(_nb, NotebookNode) else str(_nb),
-                "images": get_images(html_),
-                "links": get_links(html_)
-               }
+        return notebook_links_and_images(NotebookContext(nb),
+                                         "RAW" if isinstance(_nb, NotebookNode) else str(_nb))
         
     retvals = []
 
@@ -671,20 +835,23 @@ def nb_md_links_and_images(nb):
 
 # -
 
+def notebook_warnings(ctx, label=''):
+    """Identify std_error outputs in the code cells of a parsed notebook (`NotebookContext`)."""
+    _warnings = []
+    for i, cell in ctx.artefact('outputs', _cell_outputs):
+        for output in cell["outputs"]:
+            if "name" in output and output["name"] == "stderr":
+                msg = output["text"].split("\n")[0]
+                _warnings.append((label, i+1,
+                                  f'<pre><code>{cell["source"]}</code></pre>',
+                                  msg))
+    return _warnings
+
 def get_warnings(nb):
     """Iterate code cell outputs to identify std_error outputs."""
     def _get_warnings(nb):
         _nb = get_nb(nb)
-        _warnings = []
-        for i, cell in enumerate(_nb["cells"]):
-            if "outputs" in cell:
-                for output in cell["outputs"]:
-                    if "name" in output and output["name"] == "stderr":
-                        msg = output["text"].split("\n")[0]
-                        _warnings.append((nb, i+1,
-                                          f'<pre><code>{cell["source"]}</code></pre>',
-                                          msg))
-        return _warnings
+        return notebook_warnings(NotebookContext(_nb), nb)
     warnings = []
     if Path(nb).is_dir():
         for p in sorted(Path(nb).rglob("*.ipynb")):
@@ -743,20 +910,40 @@ def safe_concat(d):
             df = pd.concat(d, ignore_index=True, sort=False).copy()
     return df
 
+def concat_reports(dfs):
+    """Combine a list of report dataframes, ignoring any empty ones, in a single concatenation."""
+    dfs = [df for df in dfs if not df.empty]
+    if not dfs:
+        return pd.DataFrame()
+    with warnings.catch_warnings():
+        warnings.simplefilter(action="ignore", category=FutureWarning)
+        return pd.concat(dfs, ignore_index=True, sort=False)
+
+# + [markdown] editable=true slideshow={"slide_type": ""}
+# Growing a report by calling `safe_concat()` once per row copies all the rows collected so far every time, which takes time quadratic in the number of rows. Instead, we collect the cell reports as a list of records (dicts), or the notebook reports as a list of dataframes, and only build the combined dataframe once we have them all.
+#
+# Rather than parsing each markdown cell with its own call to `nlp()`, we can stream all the markdown cells in a notebook through `nlp.pipe()`, which parses them in batches (and optionally across several processes). The docs are returned in cell order, so we can just pull the next one off the stream each time we meet a markdown cell.
+
 # + editable=true slideshow={"slide_type": ""}
-def process_notebook_md(nb, fn=''):
+def md_cell_docs(nb, batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS, nlp_profile=DEFAULT_NLP_PROFILE):
+    """Return an iterator over spacy docs for the markdown cells in a notebook, in cell order."""
+    md_sources = [cell['source'] for cell in nb.cells if cell['cell_type']=='markdown']
+    if not md_sources:
+        # Don't load the language model if there is nothing to parse
+        return iter([])
+    return get_nlp(nlp_profile).pipe(md_sources, batch_size=batch_size, n_process=n_process)
+
+# + editable=true slideshow={"slide_type": ""}
+def process_notebook_md(nb, fn='', batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS,
+                        nlp_profile=DEFAULT_NLP_PROFILE):
     """Process all the markdown cells in a notebook."""
-    cell_reports = pd.DataFrame()
+    cell_records = []
+    md_docs = md_cell_docs(nb, batch_size=batch_size, n_process=n_process, nlp_profile=nlp_profile)
 
     for i, cell in enumerate(nb.cells):
         if cell['cell_type']=='markdown':
-            _metrics = process_notebook_md_doc( nlp( cell['source'] ))
-            _metrics['cell_index'] = i
-            _metrics['cell_type'] = 'md'
-            # cell_reports = cell_reports.append(_metrics, sort=False)
-            cell_reports = safe_concat(
-                        [cell_reports, _metrics]
-                    )
+            cell_records.append({**md_doc_record(next(md_docs)), 'cell_index': i, 'cell_type': 'md'})
+    cell_reports = pd.DataFrame(cell_records)
     cell_reports['filename'] = fn
     cell_reports.reset_index(drop=True, inplace=True)
     return cell_reports
@@ -812,6 +999,7 @@ def process_notebook_md(nb, fn=''):
 
 # +
 import os
+import itertools
 
 def _nb_dir_file_profiler(path, _f, report=False):
     """Get the profile for a single file on a specified path."""
@@ -824,52 +1012,107 @@ def _nb_dir_file_profiler(path, _f, report=False):
 
 def nb_dir_profiler(path):
     """Profile all the notebooks in a specific directory."""
-    nb_dir_report = pd.DataFrame()
-    for _f in os.listdir(path):
-        # nb_dir_report = nb_dir_report.append( _nb_dir_profiler(path, _f), sort=False )
-        _df=_nb_dir_profiler(path, _f)
-        nb_dir_report = safe_concat(
-                [nb_dir_report, _df]
-            )
+    nb_dir_report = concat_reports([_nb_dir_file_profiler(path, _f) for _f in sorted(os.listdir(path))])
     # nb_dir_report['path'] = path
     return nb_dir_report   
 
 
 # +
 # nb_dir_profiler('.')
-# -
+
+# + [markdown] editable=true slideshow={"slide_type": ""}
+# On slow (for example, network) file systems, a lot of time can be spent waiting for notebooks to be read before we can get on with profiling them. So when we profile a set of notebooks, we read and parse them ahead of time in a small pool of threads while the notebooks that have already been read are being profiled. Only a limited number of notebooks are read ahead, so memory use stays bounded however many notebooks there are.
+
+# + editable=true slideshow={"slide_type": ""}
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+def prefetch(items, read, workers=READ_WORKERS, read_ahead=READ_AHEAD):
+    """Generate (item, read(item)) pairs in order, reading up to `read_ahead` items ahead in a pool of threads."""
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in items:
+            pending.append((item, executor.submit(read, item)))
+            if len(pending) >= read_ahead:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
 
 # ### Analysing Notebooks Across Multiple Directories
 #
 # As well as analysing all the notebooks contained within a single directory, we may want to automate the production of reports at the directory level across multiple directories.
 
-def nb_multidir_profiler(path, exclude = 'default'):
-    """Profile all the notebooks in a specific directory and in any child directories."""
+def _multidir_notebook_reports(fns, batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS,
+                               nlp_profile=DEFAULT_NLP_PROFILE, cell_cache=None, text_store=None):
+    """Generate the reports for a list of notebook files."""
+    # Parse the markdown across all the notebooks in a single stream
+    notebooks = prefetch(fns, lambda f: NotebookContext.from_file(f, text_formats=False))
+    stamps = {}
+    def _notebooks():
+        for f, ctx in notebooks:
+            stamps[f] = ctx.stamp
+            yield f, ctx
+    for f, _df in process_notebook_corpus(_notebooks(),
+                                          batch_size=batch_size, n_process=n_process,
+                                          nlp_profile=nlp_profile, cell_cache=cell_cache,
+                                          text_store=text_store):
+        yield {"big_report": _df, FILE_STAMP: stamps.pop(f)}
+
+def nb_multidir_profiler(path, exclude = 'default', batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS,
+                         nlp_profile=DEFAULT_NLP_PROFILE, cell_cache=None, text_store=None, jobs=PROFILE_JOBS):
+    """Profile all the notebooks in a specific directory and in any child directories.
+    
+    If a `TextStore` is provided, the cell text is kept in the store rather than in the report.
+    If `jobs` is more than 1, the notebooks are profiled by that many worker processes."""
 
     if exclude == 'default':
         exclude_paths = ['.ipynb_checkpoints', '.git', '.ipynb', '__MACOSX']
     else:
         # If we set exclude, we need to pass it as a list
         exclude_paths = exclude
-    nb_multidir_report = pd.DataFrame()
-    for _path, dirs, files in os.walk(path):
-        # Start walking...
-        # If we're in a directory that is not excluded...
-        if not set(exclude_paths).intersection(set(_path.split('/'))):
-            # Profile that directory...
-            nb_dir_report = pd.DataFrame()
-            for _f in files:
-                # nb_dir_report = nb_dir_report.append( _nb_dir_file_profiler(_path, _f), sort=False )
-                _df = _nb_dir_file_profiler(_path, _f)
-                nb_dir_report = safe_concat([nb_dir_report,_df])
-            if not nb_dir_report.empty:
-                nb_dir_report['path'] = _path
-                # nb_multidir_report = nb_multidir_report.append(nb_dir_report, sort=False)
-                nb_multidir_report =safe_concat([nb_multidir_report, nb_dir_report])
+
+    def _walk_notebooks():
+        """Generate (directory, notebook path) pairs for notebooks in directories that are not excluded."""
+        for _path, dirs, files in os.walk(path):
+            # Start walking...
+            # If we're in a directory that is not excluded...
+            if not set(exclude_paths).intersection(set(_path.split('/'))):
+                for _f in files:
+                    if _f.endswith('.ipynb'):
+                        yield _path, os.path.join(_path, _f)
+
+    def _process(fns):
+        """Generate the reports for a list of notebook files."""
+        if jobs > 1:
+            return parallel_notebook_reports(fns, _multidir_notebook_reports, jobs=jobs, nlp_profile=nlp_profile,
+                                             text_store=text_store, batch_size=batch_size, n_process=n_process)
+        return _multidir_notebook_reports(fns, batch_size=batch_size, n_process=n_process, nlp_profile=nlp_profile,
+                                          cell_cache=cell_cache, text_store=text_store)
+
+    notebooks = list(_walk_notebooks())
+    if cell_cache is not None:
+        # Forget about any notebooks that have been deleted
+        cell_cache.prune_files([path], [f for _, f in notebooks])
+    nb_reports = incremental_notebook_reports([f for _, f in notebooks], _process, cell_cache=cell_cache,
+                                              nlp_profile=nlp_profile, context='nb_multidir_profiler',
+                                              text_store=text_store)
+
+    nb_dir_reports = []
+    # os.walk visits each directory once, so notebooks in the same directory are adjacent
+    for _path, dir_reports in itertools.groupby(zip(notebooks, nb_reports), key=lambda r: r[0][0]):
+        # Profile that directory...
+        nb_dir_report = concat_reports([_reports["big_report"] for _, (_, _reports) in dir_reports])
+        if not nb_dir_report.empty:
+            nb_dir_report['path'] = _path
+            nb_dir_reports.append(nb_dir_report)
+    nb_multidir_report = concat_reports(nb_dir_reports)
     if not nb_multidir_report.empty:
         nb_multidir_report = nb_multidir_report.sort_values(by=['path', 'filename'])
 
         nb_multidir_report.reset_index(drop=True, inplace=True)
+        add_corpus_keyterms(nb_multidir_report)
 
     return nb_multidir_report   
 
@@ -1130,12 +1373,15 @@ def robust_code_cell_analyse(c, parser='radon'):
 # We now need to start pulling together a function that we can cal to run the basic report and other code cell reports.
 
 # + editable=true slideshow={"slide_type": ""}
+def code_text_record(txt):
+    """Generate the code cell report as a dict."""
+    basic_code_report = robust_code_cell_analyse(txt)
+    return {'text':txt,
+            **basic_code_report }
+
 def process_notebook_code_text(txt):
     """Generate code cell report."""
-    report = pd.DataFrame()
-    basic_code_report = robust_code_cell_analyse(txt)
-    return pd.DataFrame([{'text':txt,
-                          **basic_code_report }])
+    return pd.DataFrame([code_text_record(txt)])
 
 
 # + [markdown] editable=true slideshow={"slide_type": ""}
@@ -1148,36 +1394,56 @@ def process_notebook_code_text(txt):
 # In order to process code cells as well as markdown cells in our notebook processer, we will need build on the `process_notebook_md()` function to create a more general one. Note that the current approach will give us an inefficient dataframe, column wise, in that whilst each row represents the report from a code cell *or* a markdown cell, the columns cover reports from both code *and* markdown cells.
 
 # + editable=true slideshow={"slide_type": ""}
-def process_notebook(nb, fn=''):
+def _index_cell_metrics(_metrics, i, cell_type):
+    """Add the cell index and cell type to a cell report record."""
+    return {**_metrics, 'cell_index': i, 'cell_type': cell_type}
+
+def _cached_cell_metrics(cell_cache, key, i, cell_type):
+    """Get a cell report record from the cell cache, or None if it isn't cached."""
+    report = cell_cache.get(key)
+    if report is None:
+        return None
+    return _index_cell_metrics(report, i, cell_type)
+
+def _md_cell_metrics(doc, i, cell_cache=None, key=None):
+    """Generate the report record for a single markdown cell."""
+    _metrics = md_doc_record(doc)
+    if cell_cache is not None:
+        cell_cache.put(key, _metrics)
+    return _index_cell_metrics(_metrics, i, 'md')
+
+def _code_cell_metrics(txt, i, cell_cache=None, _source_hash=None):
+    """Generate the report record for a single code cell."""
+    if cell_cache is not None:
+        key = cell_cache.key(txt, 'code', _source_hash=_source_hash)
+        _metrics = _cached_cell_metrics(cell_cache, key, i, 'code')
+        if _metrics is not None:
+            return _metrics
+    _metrics = code_text_record(txt)
+    if cell_cache is not None:
+        cell_cache.put(key, _metrics)
+    return _index_cell_metrics(_metrics, i, 'code')
+
+def process_notebook(nb, fn='', batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS,
+                     nlp_profile=DEFAULT_NLP_PROFILE, cell_cache=None, text_store=None):
     """Process all the markdown and code cells in a notebook."""
-    cell_reports = pd.DataFrame()
-
-    for i, cell in enumerate(nb.cells):
-        if cell['cell_type']=='markdown':
-            _metrics = process_notebook_md_doc( nlp( cell['source'] ))
-            _metrics['cell_index'] = i
-            _metrics['cell_type'] = 'md'
-            # cell_reports = cell_reports.append(_metrics, sort=False)
-            cell_reports = safe_concat([cell_reports, _metrics])
-        elif cell['cell_type']=='code':
-            _metrics = process_notebook_code_text(cell['source'] )
-            _metrics["cell_index"] = i
-            _metrics['cell_type'] = 'code'
-            # cell_reports = cell_reports.append(_metrics, sort=False)
-            cell_reports = safe_concat([cell_reports, _metrics])
-    cell_reports['filename'] = fn
-    cell_reports.reset_index(drop=True, inplace=True)
+    # A notebook is processed as a corpus of one notebook (see `process_notebook_corpus()` below)
+    _, cell_reports = next(process_notebook_corpus([(fn, nb)], batch_size=batch_size, n_process=n_process,
+                                                   nlp_profile=nlp_profile, cell_cache=cell_cache,
+                                                   text_store=text_store))
     return cell_reports
 
 
 # + editable=true slideshow={"slide_type": ""}
 # This is the full code and markdown processor
-def process_notebook_file(fn):
+def process_notebook_file(fn, batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS,
+                          nlp_profile=DEFAULT_NLP_PROFILE, cell_cache=None, text_store=None):
     """Grab cell level statistics across a whole notebook."""
     
     nb = get_nb(fn, display_path=False)
     try:
-        cell_reports = process_notebook(nb, fn=fn)
+        cell_reports = process_notebook(nb, fn=fn, batch_size=batch_size, n_process=n_process,
+                                        nlp_profile=nlp_profile, cell_cache=cell_cache, text_store=text_store)
     except:
         print(f'FAILED to process {fn}')
         cell_reports = pd.DataFrame()
@@ -1186,6 +1452,185 @@ def process_notebook_file(fn):
     return cell_reports
 
 
+# + [markdown] editable=true slideshow={"slide_type": ""}
+# When we profile lots of notebooks, particularly short ones, parsing them one notebook at a time means that `spacy` only ever gets to work on small batches of text. Instead, we can stream the markdown cells from *every* notebook in a corpus through a single `nlp.pipe()`, tagging each cell source with the notebook and cell it came from (`as_tuples=True`), and then route the parsed docs back to their notebooks.
+#
+# The docs come back from the pipe in the order the cells went in, so as soon as we see a doc from one notebook we know that all the notebooks before it are complete and their reports can be generated.
+#
+# Most cells in a set of course notebooks don't change from one run to the next, so we can also keep a persistent cache of cell reports, keyed on the cell content (see `cell_cache.py`). Cells whose reports are in the cache aren't sent to `spacy` at all.
+
+# + editable=true slideshow={"slide_type": ""}
+from .text_store import store_report_text
+
+def _assemble_cell_reports(cell_metrics, fn='', text_store=None):
+    """Combine cell report records, keyed by cell index, into a notebook report."""
+    if cell_metrics is None:
+        print(f'FAILED to process {fn}')
+        return pd.DataFrame()
+    cell_reports = pd.DataFrame([cell_metrics[i] for i in sorted(cell_metrics)])
+    if text_store is not None:
+        cell_reports = store_report_text(cell_reports, text_store)
+    cell_reports['filename'] = fn
+    cell_reports.reset_index(drop=True, inplace=True)
+    return cell_reports
+
+def process_notebook_corpus(notebooks, batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS,
+                            nlp_profile=DEFAULT_NLP_PROFILE, cell_cache=None, text_store=None):
+    """Process all the markdown and code cells in a corpus of notebooks,
+        parsing the markdown cells from every notebook in a single spacy stream.
+    
+    `notebooks` is an iterable of (fn, nb) pairs, where nb is a notebook or `NotebookContext`,
+    or None if the notebook could not be read.
+    If a `CellCache` is provided, cell reports are looked up in, and added to, the cache.
+    If a `TextStore` is provided, the cell text is moved into the store, and the reports
+    just refer to it (see `text_store.py`).
+    Generates (fn, cell_reports) pairs in the same order as the notebooks."""
+    # Notebooks that have been read but whose report has not been generated yet
+    pending = deque()
+    # Cell reports keyed by notebook position then cell index; None if the notebook failed
+    corpus_metrics = {}
+
+    def _md_cells():
+        """Generate (source, (notebook position, cell index, cache key)) tuples
+            for each markdown cell in the corpus that needs parsing."""
+        for n, (fn, nb) in enumerate(notebooks):
+            pending.append((n, fn))
+            ctx = nb if isinstance(nb, NotebookContext) else NotebookContext(nb, fn)
+            corpus_metrics[n] = None if ctx.nb is None else {}
+            if ctx.nb is None:
+                continue
+            try:
+                md_cells = []
+                for i, cell in enumerate(ctx.cells):
+                    if cell['cell_type']=='markdown':
+                        key = None
+                        if cell_cache is not None:
+                            key = cell_cache.key(cell['source'], 'markdown', SPACY_LANG_MODEL, nlp_profile,
+                                                 _source_hash=ctx.cell_hashes[i])
+                            _metrics = _cached_cell_metrics(cell_cache, key, i, 'md')
+                            if _metrics is not None:
+                                corpus_metrics[n][i] = _metrics
+                                continue
+                        md_cells.append((cell['source'], (n, i, key)))
+                    elif cell['cell_type']=='code':
+                        _hash = ctx.cell_hashes[i] if cell_cache is not None else None
+                        corpus_metrics[n][i] = _code_cell_metrics(cell['source'], i, cell_cache, _hash)
+            except:
+                corpus_metrics[n] = None
+                continue
+            yield from md_cells
+
+    def _completed(upto=None):
+        """Generate the reports for pending notebooks that precede notebook `upto`."""
+        while pending and (upto is None or pending[0][0] < upto):
+            n, fn = pending.popleft()
+            if cell_cache is not None:
+                cell_cache.flush()
+            cell_reports = _assemble_cell_reports(corpus_metrics.pop(n), fn, text_store)
+            if text_store is not None:
+                text_store.flush()
+            yield fn, cell_reports
+
+    md_cells = _md_cells()
+    # Peek at the stream so we don't load the language model if there is no markdown to parse
+    first = next(md_cells, None)
+    if first is not None:
+        docs = get_nlp(nlp_profile).pipe(itertools.chain([first], md_cells), as_tuples=True,
+                              batch_size=batch_size, n_process=n_process)
+        for doc, (n, i, key) in docs:
+            yield from _completed(n)
+            if corpus_metrics[n] is None:
+                continue
+            try:
+                corpus_metrics[n][i] = _md_cell_metrics(doc, i, cell_cache, key)
+            except:
+                corpus_metrics[n] = None
+    yield from _completed()
+
+
+# + [markdown] editable=true slideshow={"slide_type": ""}
+# When we profile the same set of notebooks again, most of the files won't have changed at all. If a cell cache is available, we can keep the reports generated for each file alongside the file's size, modification time and content hash, and reuse them for any files that are unchanged without even reading the notebook.
+
+# + editable=true slideshow={"slide_type": ""}
+def incremental_notebook_reports(fns, process, cell_cache=None, nlp_profile=DEFAULT_NLP_PROFILE, context='',
+                                 text_store=None):
+    """Generate (fn, reports) pairs for a list of notebook files,
+        reusing the stored reports for any files that haven't changed.
+    
+    `process` is called with the list of files that do need processing
+    and must generate a reports dict for each of them, in order, including the `FILE_STAMP`
+    of the file contents each was generated from (see `NotebookContext.from_file()`).
+    `context` identifies the report configuration the reports depend on.
+    If the reports refer to text in a `TextStore`, they can only be reused with that store."""
+    if cell_cache is None:
+        for fn, reports in zip(fns, process(fns)):
+            reports.pop(FILE_STAMP, None)
+            yield fn, reports
+        return
+    context = ':'.join([context, cell_cache.context('markdown', SPACY_LANG_MODEL, nlp_profile),
+                        text_store.store_id if text_store is not None else ''])
+    stored = {}
+    for fn in fns:
+        reports = cell_cache.get_file(fn, context)
+        if reports is not None:
+            stored[fn] = reports
+    fresh = process([fn for fn in fns if fn not in stored])
+    for fn in fns:
+        if fn in stored:
+            yield fn, stored[fn]
+            continue
+        reports = next(fresh)
+        stamp = reports.pop(FILE_STAMP, None)
+        # Notebooks that could not be profiled have an empty big report;
+        # don't store those so they are retried (and reported) the next time round
+        if stamp is not None and ("big_report" not in reports or not reports["big_report"].empty):
+            cell_cache.put_file(fn, context, reports, stamp)
+        yield fn, reports
+    cell_cache.flush()
+
+
+# + [markdown] editable=true slideshow={"slide_type": ""}
+# Profiling a large set of notebooks is CPU bound, so we can also share the notebooks that need processing between several worker processes. Each worker loads the language model once, when it starts, and then profiles a chunk of notebooks at a time. The reports are generated in the same order as the notebooks, whatever order the chunks complete in, so the result is the same as a serial run.
+#
+# The cell cache and text store are only used by the main process: SQLite doesn't like lots of processes writing to the same database, and the text store index is held in memory.
+
+# + editable=true slideshow={"slide_type": ""}
+from concurrent.futures import ProcessPoolExecutor
+
+def _init_profile_worker(nlp_profile, load_nlp):
+    """Load the language model once in each worker process."""
+    if load_nlp:
+        get_nlp(nlp_profile)
+
+def _profile_worker(process, fns, kwargs):
+    """Generate the reports for a chunk of notebook files in a worker process."""
+    return list(process(fns, **kwargs))
+
+def parallel_notebook_reports(fns, process, jobs=PROFILE_JOBS, nlp_profile=DEFAULT_NLP_PROFILE, load_nlp=True,
+                              text_store=None, chunk_size=None, **kwargs):
+    """Generate a reports dict for each of a list of notebook files, in order, using `jobs` worker processes.
+    
+    `process(fns, **kwargs)` must be a module level function that generates a reports dict for each file.
+    If a `TextStore` is provided, the text in the big reports is moved into it as the reports come back."""
+    fns = list(fns)
+    if not fns:
+        return
+    # Several chunks per worker, so that a few big notebooks don't hold everything up
+    chunk_size = chunk_size or math.ceil(len(fns) / (jobs * 4))
+    chunks = [fns[i:i+chunk_size] for i in range(0, len(fns), chunk_size)]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(chunks)), initializer=_init_profile_worker,
+                             initargs=(nlp_profile, load_nlp)) as executor:
+        # `map()` returns the results in the order the chunks were submitted
+        for chunk_reports in executor.map(_profile_worker, itertools.repeat(process), chunks,
+                                          itertools.repeat(kwargs)):
+            for reports in chunk_reports:
+                if text_store is not None and "big_report" in reports:
+                    reports["big_report"] = store_report_text(reports["big_report"], text_store)
+                yield reports
+        if text_store is not None:
+            text_store.flush()
+
+
 # + [markdown] editable=true slideshow={"slide_type": ""}
 # We should now be able to generate a report that includes statistics from code as well as markdown cells.
 
@@ -1199,6 +1644,57 @@ def process_notebook_file(fn):
 # + tags=["active-ipynb"] editable=true slideshow={"slide_type": ""}
 # report.columns
 
+# + [markdown] editable=true slideshow={"slide_type": ""}
+# The acronyms are reported cell by cell, but we can also merge them into a single glossary for a notebook, or for all the notebooks in a report:
+
+# + editable=true slideshow={"slide_type": ""}
+def report_acronyms(ddf):
+    """Merge the acronyms found in each markdown cell of a report dataframe into a single glossary."""
+    if 'acronyms' not in ddf.columns:
+        return {}
+    # Code cell rows don't have an acronyms dict
+    return merge_acronyms(a for a in ddf['acronyms'] if isinstance(a, dict))
+
+
+# + tags=["active-ipynb"] editable=true slideshow={"slide_type": ""}
+# report_acronyms(report)
+
+# + [markdown] editable=true slideshow={"slide_type": ""}
+# Key terms are only really meaningful relative to a corpus: a term is "key" to a notebook if it is used a lot in that notebook but not in the others. So rather than extracting key terms cell by cell, we fit a single TF-IDF model over the lemmatised markdown of all the notebooks in a report, treating each notebook as a document, and then score each notebook, and each markdown cell, against it.
+#
+# The lemmatised text is only available if the `spacy` pipeline includes the lemmatizer (the `full` pipeline profile). The TF-IDF scores are kept as sparse matrices throughout, so this scales to large corpora.
+
+# + editable=true slideshow={"slide_type": ""}
+KEYTERMS_N = 10 # number of key terms to report for each notebook and cell
+
+def corpus_keyterms(ddf, n=KEYTERMS_N, grouper='filename'):
+    """Extract key terms for each notebook and each markdown cell in a report dataframe.
+        Returns a dict of cell key term dicts keyed by row index, and a dict of notebook key term lists."""
+    if 'keyterm_text' not in ddf.columns:
+        return {}, {}
+    md_ddf = ddf[ddf['keyterm_text'].notna()]
+    nb_texts = md_ddf.groupby(grouper, sort=False)['keyterm_text'].agg(' '.join)
+    try:
+        vectorizer, nb_tfidf = fit_keyterms(nb_texts.tolist())
+    except ValueError:
+        # There are no terms to extract
+        return {}, {}
+    nb_keyterms = dict(zip(nb_texts.index, top_keyterms(vectorizer, nb_tfidf, n)))
+    cell_tfidf = vectorizer.transform(md_ddf['keyterm_text'])
+    cell_keyterms = {i: dict(t) for i, t in zip(md_ddf.index, top_keyterms(vectorizer, cell_tfidf, n))}
+    return cell_keyterms, nb_keyterms
+
+def add_corpus_keyterms(ddf, n=KEYTERMS_N, grouper='filename'):
+    """Fill in the cell key terms in a report dataframe and return the notebook key terms."""
+    cell_keyterms, nb_keyterms = corpus_keyterms(ddf, n=n, grouper=grouper)
+    if cell_keyterms:
+        ddf['keyterms'] = [cell_keyterms.get(i, k) for i, k in zip(ddf.index, ddf['keyterms'])]
+    return nb_keyterms
+
+
+# + tags=["active-ipynb"] editable=true slideshow={"slide_type": ""}
+# nb_keyterms = add_corpus_keyterms(report)
+
 # + [markdown] editable=true slideshow={"slide_type": ""}
 # And let's see if our directory processor now also includes code cell statistics:
 
@@ -1213,6 +1709,124 @@ def process_notebook_file(fn):
 # code_cols = [c for c in ddf2.columns if 'code' in c]
 # ddf2[ddf2['cell_type']=='code'][code_cols].sum()
 
+# + [markdown] editable=true slideshow={"slide_type": ""}
+# As noted above, the combined report is an inefficient dataframe, column wise. Every row carries the markdown *and* the code columns, most of which are then `NaN`, counts end up stored as 64 bit floats, and the cell type, filename, path and name strings are repeated on every row. For large corpora, we can convert the report to a compact, typed schema:
+#
+# - repeated strings are stored as categories;
+# - counts are stored in the narrowest (nullable) unsigned integer type that holds them;
+# - other measures are stored as 32 bit floats;
+#
+# and optionally split it into separate markdown and code cell tables, each holding only its own columns.
+
+# + editable=true slideshow={"slide_type": ""}
+import numpy as np
+
+# The column types in the compact report schema:
+# "category" for repeated strings, "count" for non-negative integers, "float" for other measures,
+# "offset" for file offsets, and "object" for text and other Python objects
+CELL_REPORT_KEY_SCHEMA = {
+    "filename": "category",
+    "path": "category",
+    "name": "category",
+    "cell_index": "count",
+    "cell_type": "category",
+}
+
+CODE_REPORT_SCHEMA = {
+    "text": "object",
+    # If the cell text is kept in a `TextStore`, the report refers to it instead
+    "text_hash": "object",
+    "text_offset": "offset",
+    "text_length": "count",
+    "n_screen_lines": "count",
+    "n_total_code_lines": "count",
+    "n_code_lines": "count",
+    "n_blank_code_lines": "count",
+    "n_single_line_comment_code_lines": "count",
+    "reading_time_s": "float",
+    "reading_time_mins": "count",
+}
+
+MD_REPORT_SCHEMA = {
+    **CODE_REPORT_SCHEMA,
+    "n_chars": "count",
+    "n_words": "count",
+    "n_sents": "count",
+    "n_unique_words": "count",
+    "n_syllables": "count",
+    "n_monosyllable_words": "count",
+    "n_polysyllable_words": "count",
+    "n_long_words": "count",
+    "sentence_length_mean": "float",
+    "sentence_length_median": "float",
+    "sentence_length_stdev": "float",
+    "sentence_legths": "object",
+    "flesch_reading_ease": "float",
+    "flesch_kincaid_grade_level": "float",
+    "automated_readability_index": "float",
+    "coleman_liau_index": "float",
+    "smog_index": "float",
+    "gunning_fog_index": "float",
+    "n_headers": "count",
+    "n_paras": "count",
+    "n_code_blocks": "count",
+    "acronyms": "object",
+    "keyterms": "object",
+    "keyterm_text": "object",
+}
+
+REPORT_SCHEMA = {**MD_REPORT_SCHEMA, **CELL_REPORT_KEY_SCHEMA}
+
+def _count_dtype(s):
+    """Get the narrowest nullable unsigned integer dtype that can hold a count column."""
+    _max = s.max()
+    for dtype in ["UInt8", "UInt16", "UInt32"]:
+        if pd.isna(_max) or _max <= np.iinfo(dtype.lower()).max:
+            return dtype
+    return "UInt64"
+
+def compact_report(ddf, schema=REPORT_SCHEMA):
+    """Convert a cell report dataframe to the compact report schema.
+    
+    Columns that aren't in the schema are left as they are."""
+    columns = {}
+    for col in ddf.columns:
+        kind = schema.get(col)
+        if kind == "category":
+            # Stringify the values (e.g. `Path` filenames), but keep missing values missing rather than "nan"
+            columns[col] = ddf[col].map(str, na_action="ignore").astype("category")
+        elif kind == "count":
+            columns[col] = ddf[col].astype(_count_dtype(ddf[col]))
+        elif kind == "float":
+            columns[col] = ddf[col].astype("float32")
+        elif kind == "offset":
+            columns[col] = ddf[col].astype("UInt64")
+        else:
+            columns[col] = ddf[col]
+    return pd.DataFrame(columns, index=ddf.index)
+
+def split_report(ddf):
+    """Split a cell report dataframe into compact markdown and code cell tables."""
+    md_cols = [c for c in ddf.columns if c not in REPORT_SCHEMA or c in MD_REPORT_SCHEMA
+               or c in CELL_REPORT_KEY_SCHEMA]
+    code_cols = [c for c in ddf.columns if c in CODE_REPORT_SCHEMA or c in CELL_REPORT_KEY_SCHEMA]
+    return {
+        "md": compact_report(ddf.loc[ddf["cell_type"] == "md", md_cols].reset_index(drop=True)),
+        "code": compact_report(ddf.loc[ddf["cell_type"] == "code", code_cols].reset_index(drop=True)),
+    }
+
+def report_memory_per_cell(ddf, deep=True):
+    """Get the memory used by a report dataframe, or dict of dataframes, in bytes per cell."""
+    ddfs = ddf.values() if isinstance(ddf, dict) else [ddf]
+    n_cells = sum(len(_ddf) for _ddf in ddfs)
+    if not n_cells:
+        return 0
+    return sum(_ddf.memory_usage(index=True, deep=deep).sum() for _ddf in ddfs) / n_cells
+
+
+# + tags=["active-ipynb"] editable=true slideshow={"slide_type": ""}
+# report_memory_per_cell(ddf2), report_memory_per_cell(compact_report(ddf2)), report_memory_per_cell(split_report(ddf2))
+
 # + [markdown] editable=true slideshow={"slide_type": ""}
 # ### Generating Reports Across Multiple Directories
 #
@@ -1271,96 +1885,64 @@ Estimated total reading time of {reading_time_mins} minutes.
 
 """
 
-# + editable=true slideshow={"slide_type": ""}
-# Now let's add those extra requirements to the the feedstock generator:
-def notebook_report_feedstock(ddf, grouper=None):
-    """Create a feedstock dict for report generation. Keyed by directory path and optionally by name."""
-    if grouper is None:
-        grouper = ["path"]
-
-    ddf_dict = (
-        ddf.groupby(grouper)[
-            [
-                "n_words",
-                "reading_time_mins",
-                "reading_time_s",
-                "n_code_lines",
-                "n_single_line_comment_code_lines",
-                "n_total_code_lines",
-                "n_blank_code_lines",
-            ]
-        ]
-        .sum()
-        .to_dict(orient="index")
-    )
-
-    notebook_counts = ddf.groupby(grouper)["filename"].nunique().to_dict()
-    notebook_counts = {k: {"nb_count": notebook_counts[k]} for k in notebook_counts}
-
-    report_dict = always_merger.merge(ddf_dict, notebook_counts)
-
-    code_cell_counts = ddf[ddf["cell_type"] == "code"].groupby(grouper).size().to_dict()
-    md_cell_counts = ddf[ddf["cell_type"] == "md"].groupby(grouper).size().to_dict()
-
-    for k in report_dict:
-        report_dict[k]["path"] = k[0] if isinstance(k, tuple) else k
-        if isinstance(k, tuple) and len(k) > 1:
-            report_dict[k]["name"] = k[1]
-        report_dict[k]["n_code_cells"] = (
-            code_cell_counts[k] if k in code_cell_counts else "NA"
-        )
-        report_dict[k]["n_md_cells"] = (
-            md_cell_counts[k] if k in md_cell_counts else "NA"
-        )
-
-    return report_dict
+# + [markdown] editable=true slideshow={"slide_type": ""}
+# Now let's add those extra requirements to the the feedstock generator. Rather than running a separate `groupby()` for each measure and merging the results, all the measures, including the markdown and code cell counts, are aggregated in a single pass over the report. The directory level rollup can then be generated from the (much smaller) notebook level rollup rather than from the cell reports again.
 
 # + editable=true slideshow={"slide_type": ""}
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+
+# The measures that are summed over the cells in a directory or notebook
+FEEDSTOCK_SUM_COLUMNS = [
+    "n_words",
+    "reading_time_mins",
+    "reading_time_s",
+    "n_code_lines",
+    "n_single_line_comment_code_lines",
+    "n_total_code_lines",
+    "n_blank_code_lines",
+]
+
+# Directory and notebook level feedstock dicts, as generated by `notebook_report_rollups()`
+ReportRollups = namedtuple("ReportRollups", ["dirs", "notebooks"])
+
+def _feedstock_aggregate(ddf, grouper):
+    """Aggregate the cell reports in a report dataframe over `grouper` with a single groupby."""
+    cell_type = ddf["cell_type"]
+    aggs = {col: (col, "sum") for col in FEEDSTOCK_SUM_COLUMNS}
+    aggs["nb_count"] = ("_filename", "nunique")
+    aggs["n_code_cells"] = ("_code_cell", "sum")
+    aggs["n_md_cells"] = ("_md_cell", "sum")
+    # The filename may also be one of the group keys
+    return (
+        ddf[grouper + FEEDSTOCK_SUM_COLUMNS]
+        .assign(_filename=ddf["filename"], _code_cell=(cell_type == "code"), _md_cell=(cell_type == "md"))
+        .groupby(grouper, observed=True)
+        .agg(**aggs)
+    )
 
+def _feedstock_dict(agg):
+    """Convert an aggregated report to a feedstock dict, keyed by the group keys."""
+    grouper = list(agg.index.names)
+    # Directories or notebooks without any cells of a particular type are reported as "NA"
+    for col in ["n_code_cells", "n_md_cells"]:
+        agg[col] = agg[col].astype(object).where(agg[col] > 0, "NA")
+    feedstock = agg.to_dict(orient="index")
+    for k, report in feedstock.items():
+        report.update(zip(grouper, k if isinstance(k, tuple) else (k,)))
+    return feedstock
 
-# + editable=true slideshow={"slide_type": ""}
 def notebook_report_feedstock(ddf, grouper=None):
     """Create a feedstock dict for report generation. Keyed by directory path and optionally by name."""
     if grouper is None:
         grouper = ["path"]
+    return _feedstock_dict(_feedstock_aggregate(ddf, grouper))
 
-    ddf_dict = (
-        ddf.groupby(grouper)[
-            [
-                "n_words",
-                "reading_time_mins",
-                "reading_time_s",
-                "n_code_lines",
-                "n_single_line_comment_code_lines",
-                "n_total_code_lines",
-                "n_blank_code_lines",
-            ]
-        ]
-        .sum()
-        .to_dict(orient="index")
-    )
-
-    notebook_counts = ddf.groupby(grouper)["filename"].nunique().to_dict()
-    notebook_counts = {k: {"nb_count": notebook_counts[k]} for k in notebook_counts}
-
-    report_dict = always_merger.merge(ddf_dict, notebook_counts)
-
-    code_cell_counts = ddf[ddf["cell_type"] == "code"].groupby(grouper).size().to_dict()
-    md_cell_counts = ddf[ddf["cell_type"] == "md"].groupby(grouper).size().to_dict()
-
-    for k in report_dict:
-        report_dict[k]["path"] = k[0] if isinstance(k, tuple) else k
-        if isinstance(k, tuple) and len(k) > 1:
-            report_dict[k]["name"] = k[1]
-        report_dict[k]["n_code_cells"] = (
-            code_cell_counts[k] if k in code_cell_counts else "NA"
-        )
-        report_dict[k]["n_md_cells"] = (
-            md_cell_counts[k] if k in md_cell_counts else "NA"
-        )
-
-    return report_dict
+def notebook_report_rollups(ddf):
+    """Create the directory and notebook level feedstock dicts for report generation from a single pass over the report."""
+    notebooks = _feedstock_aggregate(ddf, ["path", "name"])
+    # Each notebook (filename) is in a single directory, so the notebook counts can also be summed
+    dirs = notebooks.groupby(level="path", observed=True).sum()
+    return ReportRollups(dirs=_feedstock_dict(dirs), notebooks=_feedstock_dict(notebooks))
 
 # + editable=true slideshow={"slide_type": ""}
 # via claude.ai
@@ -1385,8 +1967,7 @@ def multi_level_reporter(
     include_dir_report (bool): If False, only item reports will be generated
     dir_separator (str): String to insert between directory reports (e.g., '---' for a line break)
     """
-    dir_feedstock = notebook_report_feedstock(df, grouper=["path"])
-    item_feedstock = notebook_report_feedstock(df, grouper=["path", "name"])
+    dir_feedstock, item_feedstock = notebook_report_rollups(df)
 
     if group_by_dir:
         return _grouped_report(
@@ -1504,10 +2085,12 @@ def simple_reporter(df, template, path_filter='', nb_report=True):
 # Generate some simple chart versions of the reports.
 #
 # For example, bar charts of cell counts by notebook by directory.
+#
+# The charting packages take a while to import, so the package only imports them when a chart is actually drawn.
 
-# + editable=true slideshow={"slide_type": ""}
-import seaborn as sns
-import matplotlib.pyplot as plt
+# + editable=true slideshow={"slide_type": ""} tags=["active-ipynb"]
+# import seaborn as sns
+# import matplotlib.pyplot as plt
 
 # + editable=true slideshow={"slide_type": ""} tags=["active-ipynb"]
 #
@@ -1575,9 +2158,9 @@ import matplotlib.pyplot as plt
 
 # +
 # #%pip install matplotlib==3.7.5
-# -
 
-import matplotlib.pyplot as plt
+# + tags=["active-ipynb"]
+# import matplotlib.pyplot as plt
 # %matplotlib inline
 
 # + tags=["active-ipynb"]
@@ -1617,6 +2200,7 @@ def cell_attrib(cell, colour='cell_type', size='n_screen_lines'):
 
 def nb_vis(cell_map, w=20, gap_boost=1, **kwargs):
     """Visualise notebook gross cell structure."""
+    import matplotlib.pyplot as plt
     
     def get_gap(cell_map):
         """Automatically set the gap value based on overall length"""
@@ -0,0 +1,201 @@
+# Streaming export of cell and notebook level reports to Parquet
+
+import json
+import math
+import queue
+import shutil
+import threading
+from pathlib import Path
+from urllib.parse import quote
+
+import pandas as pd
+
+from .notebook_profiler import REPORT_SCHEMA, concat_reports, notebook_report_feedstock
+
+CELLS_DATASET = "cells"
+NOTEBOOKS_TABLE = "notebooks.parquet"
+
+# Cell key terms are only available once the whole corpus has been profiled,
+# so they are reported at the notebook level instead
+CELL_REPORT_EXCLUDE = ["path", "keyterms"]
+
+NOTEBOOK_REPORT_COLUMNS = [
+    "path",
+    "name",
+    "filename",
+    "nb_count",
+    "n_md_cells",
+    "n_code_cells",
+    "n_words",
+    "reading_time_mins",
+    "reading_time_s",
+    "n_code_lines",
+    "n_single_line_comment_code_lines",
+    "n_total_code_lines",
+    "n_blank_code_lines",
+    "keyterms",
+]
+
+
+def _import_pyarrow():
+    """Import pyarrow, which is an optional dependency."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def _arrow_type(pa, kind, col):
+    """Get the Arrow type used to store a column of a given schema kind."""
+    if kind == "count":
+        return pa.uint32()
+    if kind == "offset":
+        return pa.uint64()
+    if kind == "float":
+        return pa.float32()
+    if kind == "category":
+        return pa.dictionary(pa.int32(), pa.string())
+    # Strings are stored as they are, other Python objects (lists, dicts) as JSON
+    return pa.string()
+
+
+def _is_missing(v):
+    return v is None or (isinstance(v, float) and math.isnan(v))
+
+
+def _arrow_values(ddf, col, kind):
+    """Get the values of a report column in a form that Arrow can store."""
+    if col not in ddf:
+        return [None] * len(ddf)
+    if kind == "category":
+        return [None if _is_missing(v) else str(v) for v in ddf[col]]
+    if kind == "object":
+        return [v if _is_missing(v) or isinstance(v, str) else json.dumps(v) for v in ddf[col]]
+    return ddf[col]
+
+
+class ParquetReportWriter:
+    """Write cell reports to a Parquet dataset, one directory at a time.
+
+    Cell reports are written to a `cells` dataset, partitioned (Hive style) by notebook `path`,
+    and notebook level summaries to `notebooks.parquet`. Every file in the dataset has the
+    same schema, so the whole dataset can be opened (or memory mapped) in one go with
+    `pandas.read_parquet()` or `pyarrow.dataset.dataset(..., partitioning="hive")`.
+
+    Any reports previously written to `out_dir` are replaced."""
+
+    def __init__(self, out_dir, max_rows=100000):
+        self.pa = _import_pyarrow()
+        self.out_dir = Path(out_dir)
+        shutil.rmtree(self.out_dir / CELLS_DATASET, ignore_errors=True)
+        (self.out_dir / CELLS_DATASET).mkdir(parents=True, exist_ok=True)
+        self.max_rows = max_rows
+        self.schema = self.pa.schema(
+            [
+                (col, _arrow_type(self.pa, kind, col))
+                for col, kind in REPORT_SCHEMA.items()
+                if col not in CELL_REPORT_EXCLUDE
+            ]
+        )
+        self._path = None
+        self._buffer = []
+        self._n_rows = 0
+        self._n_parts = 0
+        self._notebooks = []
+
+    def write_notebook(self, ddf):
+        """Add the cell reports for a notebook. The reports must include `path` and `name` columns."""
+        if ddf.empty:
+            return
+        path = str(ddf["path"].iloc[0])
+        if path != self._path or self._n_rows >= self.max_rows:
+            self.flush()
+        self._path = path
+        self._buffer.append(ddf)
+        self._n_rows = self._n_rows + len(ddf)
+
+    def flush(self):
+        """Write the buffered cell reports for the current directory."""
+        if not self._buffer:
+            return
+        ddf = concat_reports(self._buffer)
+        table = self.pa.table(
+            {
+                field.name: self.pa.array(
+                    _arrow_values(ddf, field.name, REPORT_SCHEMA[field.name]),
+                    type=field.type,
+                    from_pandas=True,
+                )
+                for field in self.schema
+            },
+            schema=self.schema,
+        )
+        partition = self.out_dir / CELLS_DATASET / f"path={quote(self._path, safe='')}"
+        partition.mkdir(parents=True, exist_ok=True)
+        self.pa.parquet.write_table(table, partition / f"part-{self._n_parts:05d}.parquet")
+        self._n_parts = self._n_parts + 1
+
+        feedstock = notebook_report_feedstock(ddf, grouper=["path", "name", "filename"])
+        for k, report in feedstock.items():
+            self._notebooks.append({**report, "filename": str(k[2])})
+        self._buffer = []
+        self._n_rows = 0
+
+    def close(self, nb_keyterms=None):
+        """Write any remaining cell reports and the notebook level summary."""
+        self.flush()
+        nb_keyterms = {str(k): v for k, v in (nb_keyterms or {}).items()}
+        notebooks = pd.DataFrame(self._notebooks, columns=NOTEBOOK_REPORT_COLUMNS)
+        notebooks["keyterms"] = [json.dumps(nb_keyterms.get(fn, [])) for fn in notebooks["filename"]]
+        # Cell counts are "NA" in the feedstock if a notebook has no cells of that type
+        for col in ["n_md_cells", "n_code_cells"]:
+            notebooks[col] = pd.to_numeric(notebooks[col], errors="coerce").fillna(0).astype("uint32")
+        notebooks.to_parquet(self.out_dir / NOTEBOOKS_TABLE, index=False)
+
+
+class BackgroundReportWriter:
+    """Hand the cell reports to a report writer in a background thread,
+    so that writing the reports overlaps with profiling the next notebooks.
+
+    At most `max_pending` notebook reports are queued; if the writer falls behind,
+    `write_notebook()` blocks until it catches up."""
+
+    def __init__(self, writer, max_pending=8):
+        self.writer = writer
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    def _write(self):
+        while True:
+            ddf = self._queue.get()
+            if ddf is None:
+                break
+            # Once something has gone wrong, just drain the queue
+            if self._error is None:
+                try:
+                    self.writer.write_notebook(ddf)
+                except Exception as e:
+                    self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write_notebook(self, ddf):
+        """Queue the cell reports for a notebook to be written."""
+        self._raise_error()
+        self._queue.put(ddf)
+
+    def close(self, nb_keyterms=None):
+        """Wait for the queued reports to be written, then close the writer."""
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+        self.writer.close(nb_keyterms)
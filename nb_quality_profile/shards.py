@@ -0,0 +1,209 @@
+# Split the notebooks on a path into shards that can be profiled separately,
+# e.g. on different machines, and save the partial results so they can be merged
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+# Bump this whenever the partial results format changes
+PARTIAL_RESULTS_FORMAT = 2
+
+# The partial results for a shard are saved to a directory holding:
+#
+# - `partial.json`: the shard, the full list of notebooks (as shard keys, in the order a single run
+#   would profile them), the run settings, and for each of the shard's notebooks its position in
+#   that list, its path, its reports (other than the cell reports), and a description of its cell
+#   report columns;
+# - `cells.parquet`: the cell reports for all the shard's notebooks, if the cell reports were
+#   generated, with a `_notebook` column holding the position of each row's notebook. List and
+#   dict values are stored as JSON strings, and paths as strings.
+#
+# Nothing in either file is executable, so partial results can safely be passed between machines.
+PARTIAL_META = "partial.json"
+PARTIAL_CELLS = "cells.parquet"
+NOTEBOOK_COLUMN = "_notebook"
+
+
+def parse_shard(spec):
+    """Parse a shard spec of the form "i/N" (the i'th of N shards, counting from 1) into an (i, N) tuple."""
+    try:
+        i, n = (int(part) for part in str(spec).split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must be given as i/N, not {spec}")
+    if not 1 <= i <= n:
+        raise ValueError(f"Shard {spec} is out of range: i must be between 1 and N")
+    return i, n
+
+
+def shard_key(fn, roots):
+    """Get the key used to assign a notebook to a shard.
+
+    This is the notebook's path relative to the directory it was found in, so that each notebook
+    is assigned to the same shard wherever the directory happens to be checked out."""
+    for root in roots:
+        if Path(root).is_dir():
+            try:
+                return Path(fn).relative_to(root).as_posix()
+            except ValueError:
+                pass
+    return Path(fn).name
+
+
+def notebook_shard(key, n):
+    """Get the shard (counting from 1) that a notebook with a given shard key belongs to, out of `n`.
+
+    This uses a hash of the key, rather than `hash()`, so it is the same in every process."""
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big") % n + 1
+
+
+def shard_notebooks(fns, roots, shard):
+    """Get the notebooks, from a list of notebook files found on the `roots` paths, that are in a shard."""
+    i, n = shard
+    return [fn for fn in fns if notebook_shard(shard_key(fn, roots), n) == i]
+
+
+def _encode_reports(reports):
+    """Get the reports for a notebook, other than the cell reports, as JSON values."""
+    reports = {name: report for name, report in reports.items() if name != "big_report"}
+    if "warnings" in reports:
+        # The warnings are labelled with the notebook path
+        reports["warnings"] = [(str(label), *warning) for label, *warning in reports["warnings"]]
+    return reports
+
+
+def _decode_reports(reports):
+    """Turn the JSON values saved by `_encode_reports()` back into reports."""
+    # JSON turns tuples into lists
+    if "cell_map" in reports:
+        reports["cell_map"] = [tuple(cell) for cell in reports["cell_map"]]
+    if "warnings" in reports:
+        reports["warnings"] = [(Path(label), *warning) for label, *warning in reports["warnings"]]
+    if "links_and_images" in reports:
+        for kind in ["images", "links"]:
+            reports["links_and_images"][kind] = [tuple(item) for item in reports["links_and_images"][kind]]
+    return reports
+
+
+def _encode_cells(ddf, index):
+    """Get a notebook's cell reports in a form that can be stored as Parquet, along with a description
+    of the columns that is needed to restore them."""
+    columns = {"columns": {col: str(dtype) for col, dtype in ddf.dtypes.items()}, "json": [], "paths": []}
+    ddf = ddf.copy()
+    for col in ddf.columns:
+        if ddf[col].dtype != object:
+            continue
+        values = ddf[col].dropna()
+        if values.map(lambda v: isinstance(v, Path)).all() and len(values):
+            columns["paths"].append(col)
+            ddf[col] = ddf[col].map(str, na_action="ignore")
+        elif not values.map(lambda v: isinstance(v, str)).all():
+            columns["json"].append(col)
+            ddf[col] = ddf[col].map(json.dumps, na_action="ignore")
+    ddf[NOTEBOOK_COLUMN] = index
+    return ddf, columns
+
+
+def _decode_cells(cells, columns):
+    """Restore a notebook's cell reports from the rows saved by `_encode_cells()`."""
+    if not columns["columns"]:
+        return pd.DataFrame()
+    ddf = cells[list(columns["columns"])].reset_index(drop=True)
+    for col in columns["json"]:
+        ddf[col] = ddf[col].map(json.loads, na_action="ignore")
+    for col in columns["paths"]:
+        ddf[col] = ddf[col].map(Path, na_action="ignore")
+    return ddf.astype(columns["columns"])
+
+
+def write_partial_results(out_dir, notebook_reports, shard, notebooks, **meta):
+    """Save the partial results for a shard to a directory (see `PARTIAL_META` above for the format).
+
+    `notebook_reports` is a list of (index, notebook file, reports) tuples, where `index` is the
+    notebook's position in the full list of `notebooks` (the shard keys of all the notebooks).
+    Any other keyword arguments (e.g. the path and analyses) are saved along with the results."""
+    results = []
+    cells = []
+    for index, fn, reports in notebook_reports:
+        result = {"index": index, "file": str(fn), "reports": _encode_reports(reports), "cells": None}
+        if "big_report" in reports:
+            ddf, result["cells"] = _encode_cells(reports["big_report"], index)
+            cells.append(ddf)
+        results.append(result)
+
+    # Write to a temporary directory first so a partly written result is never left behind
+    out_dir = Path(out_dir)
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    if cells:
+        from .report_writer import _import_pyarrow
+        _import_pyarrow()
+        pd.concat(cells, ignore_index=True, sort=False).to_parquet(tmp_dir / PARTIAL_CELLS, index=False)
+    with open(tmp_dir / PARTIAL_META, "w") as f:
+        json.dump({"format": PARTIAL_RESULTS_FORMAT, "shard": list(shard), "notebooks": list(notebooks),
+                   "meta": meta, "results": results}, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+
+
+def _read_partial_results(out_dir):
+    """Read the partial results saved for a shard, along with the cell reports for each of its notebooks."""
+    out_dir = Path(out_dir)
+    try:
+        with open(out_dir / PARTIAL_META) as f:
+            results = json.load(f)
+    except OSError as e:
+        raise ValueError(f"Can't read partial results from {out_dir}: {e.strerror}")
+    except ValueError:
+        results = None
+    if not isinstance(results, dict) or results.get("format") != PARTIAL_RESULTS_FORMAT:
+        raise ValueError(f"{out_dir} is not a partial results directory (or was saved by a different version)")
+    cells = None
+    if any(result["cells"] is not None for result in results["results"]):
+        from .report_writer import _import_pyarrow
+        _import_pyarrow()
+        try:
+            all_cells = pd.read_parquet(out_dir / PARTIAL_CELLS)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Can't read the cell reports in {out_dir}: {e}")
+        cells = dict(iter(all_cells.groupby(NOTEBOOK_COLUMN, sort=False)))
+    for result in results["results"]:
+        if result["cells"] is not None:
+            # Notebooks with no cells have no rows
+            result["reports"]["big_report"] = _decode_cells(cells.get(result["index"], all_cells.iloc[:0]),
+                                                            result["cells"])
+    return results
+
+
+def read_partial_results(out_dirs):
+    """Read the partial results for a complete set of shards.
+
+    Returns the saved metadata and a list of (notebook file, reports) pairs for all the
+    notebooks, in the order a single run would have profiled them."""
+    results = [_read_partial_results(out_dir) for out_dir in out_dirs]
+    if not results:
+        raise ValueError("No partial results to merge")
+
+    n = results[0]["shard"][1]
+    if any(_results["notebooks"] != results[0]["notebooks"] for _results in results):
+        raise ValueError("The partial results don't match: they come from runs over different notebooks")
+    if any(_results["meta"] != results[0]["meta"] for _results in results):
+        raise ValueError("The partial results don't match: they come from runs with different settings")
+    if any(_results["shard"][1] != n for _results in results):
+        raise ValueError("The partial results don't match: they were split into different numbers of shards")
+    shards = sorted(_results["shard"][0] for _results in results)
+    if shards != list(range(1, n + 1)):
+        missing = sorted(set(range(1, n + 1)) - set(shards))
+        duplicated = sorted({i for i in shards if shards.count(i) > 1})
+        raise ValueError(f"Need the partial results for each of the {n} shards exactly once "
+                         f"(missing: {missing or 'none'}, duplicated: {duplicated or 'none'})")
+
+    notebooks = sorted((result for _results in results for result in _results["results"]),
+                       key=lambda result: result["index"])
+    if [result["index"] for result in notebooks] != list(range(len(results[0]["notebooks"]))):
+        raise ValueError("The partial results don't cover every notebook exactly once")
+    return results[0]["meta"], [(Path(result["file"]), _decode_reports(result["reports"])) for result in notebooks]
@@ -1,4 +1,3 @@
-import readtime
 import math
 
 READING_RATE = 100 # words per minute
@@ -9,6 +8,7 @@ READING_RATE = 100 # words per minute
 
 def md_readtime(md, reading_rate=READING_RATE, rounding_override=False, rounded_minutes=False, **kwargs):
     """Get reading time in seconds."""
+    import readtime
     rt = readtime.of_markdown(md, wpm=reading_rate).delta.total_seconds()
 
     #Round up on the conversion of estimated reading time in seconds, to minutes...
@@ -1,72 +1,121 @@
 # Via Claude.ai
-import spacy
 import math
 import re
+from collections import Counter
+from itertools import islice
+import numpy as np
+
+# A syllable is approximated as a run of vowels
+_VOWEL_GROUPS = re.compile(r"[aeiou]+")
+
+# Syllable counts keyed by lowercased word; corpus vocabularies repeat heavily,
+# so most lookups hit the cache. The cache is bounded: it is emptied if it fills up.
+SYLLABLE_CACHE_SIZE = 100000
+_SYLLABLE_CACHE = {}
+
+def _count_vowel_groups(words):
+    """Count the vowel groups in each of a list of lowercased words in a single regex pass."""
+    # Join the words with a (non-vowel) space so vowel groups can't span words,
+    # then assign each vowel group to the word it starts in
+    word_starts = np.cumsum([0] + [len(w) + 1 for w in words[:-1]])
+    group_starts = np.fromiter(
+        (m.start() for m in _VOWEL_GROUPS.finditer(" ".join(words))), dtype=np.int64
+    )
+    owners = np.searchsorted(word_starts, group_starts, side="right") - 1
+    return np.bincount(owners, minlength=len(words))
+
+def count_syllables_batch(words):
+    """Count the syllables in each of an array of (ideally unique) words. Returns a numpy array of counts."""
+    words = [w.lower() for w in words]
+    counts = np.zeros(len(words), dtype=np.int64)
+    misses = []
+    for i, w in enumerate(words):
+        if w in _SYLLABLE_CACHE:
+            counts[i] = _SYLLABLE_CACHE[w]
+        else:
+            misses.append(i)
+    if misses:
+        missed_words = [words[i] for i in misses]
+        missed_counts = _count_vowel_groups(missed_words)
+        counts[misses] = missed_counts
+        if len(_SYLLABLE_CACHE) + len(misses) > SYLLABLE_CACHE_SIZE:
+            _SYLLABLE_CACHE.clear()
+        _SYLLABLE_CACHE.update(
+            islice(zip(missed_words, missed_counts.tolist()), SYLLABLE_CACHE_SIZE)
+        )
+    return counts
 
 def count_syllables(word):
     # This is a simple syllable counter and may not be 100% accurate
-    return len(
-        [
-            "".join(g)
-            for g in re.findall(r"[aeiou]+|[^aeiou]+", word.lower())
-            if g[0] in "aeiou"
-        ]
-    )
+    return int(count_syllables_batch([word])[0])
 
 # TH
 import statistics
-def sentence_lengths(doc):
-    """Generate elementary sentence length statistics."""
+def _sentence_length_stats(s_lengths):
+    """Generate mean, median and standard deviation of a list of sentence lengths."""
     s_mean = None
     s_median = None
     s_stdev = None
-    s_lengths = []
-    for sentence in doc.sents:
-        # Punctuation elements are tokens in their own right; remove these from sentence length counts
-        s_lengths.append(len([tok.text for tok in sentence if tok.pos_ != "PUNCT"]))
-
     if s_lengths:
         # If we have at least one measure, we can generate some simple statistics
         s_mean = statistics.mean(s_lengths)
         s_median = statistics.median(s_lengths)
         s_stdev = statistics.stdev(s_lengths) if len(s_lengths) > 1 else 0
+    return s_mean, s_median, s_stdev
+
+
+def sentence_lengths(doc):
+    """Generate elementary sentence length statistics."""
+    s_lengths = []
+    for sentence in doc.sents:
+        # Punctuation elements are tokens in their own right; remove these from sentence length counts
+        s_lengths.append(len([tok.text for tok in sentence if tok.pos_ != "PUNCT"]))
+
+    s_mean, s_median, s_stdev = _sentence_length_stats(s_lengths)
 
     return s_lengths, s_mean, s_median, s_stdev
 
 
 def text_stats_summary(doc):
     """Generate summary stats report using spaCy."""
-    # Basic counts
+    # Basic counts, word frequencies and sentence lengths,
+    # all accumulated in a single walk over the tokens, sentence by sentence
+    # (the sentences partition the doc, so every token is visited exactly once)
     n_chars = len(doc.text)
-    n_words = len([token for token in doc if not token.is_punct and not token.is_space])
-    n_sents = len(list(doc.sents))
-    n_unique_words = len(
-        set(
-            [
-                token.text.lower()
-                for token in doc
-                if not token.is_punct and not token.is_space
-            ]
-        )
-    )
+    n_words = 0
+    n_sents = 0
+    n_long_words = 0
+    # Word frequencies keyed by lowercased word
+    word_counts = Counter()
+    s_lengths = []
 
-    # Syllable counts
-    syllables = [
-        count_syllables(token.text)
-        for token in doc
-        if not token.is_punct and not token.is_space
-    ]
-    n_syllables = sum(syllables)
-    n_monosyllable_words = sum(1 for s in syllables if s == 1)
-    n_polysyllable_words = sum(1 for s in syllables if s >= 3)
-    n_long_words = sum(
-        1
-        for token in doc
-        if len(token.text) > 6 and not token.is_punct and not token.is_space
-    )
+    for sentence in doc.sents:
+        n_sents += 1
+        s_length = 0
+        for token in sentence:
+            # Punctuation elements are tokens in their own right; remove these from sentence length counts
+            if token.pos_ != "PUNCT":
+                s_length += 1
+            if token.is_punct or token.is_space:
+                continue
+            word = token.text
+            n_words += 1
+            word_counts[word.lower()] += 1
+            if len(word) > 6:
+                n_long_words += 1
+        s_lengths.append(s_length)
+
+    n_unique_words = len(word_counts)
+
+    # Syllable counts, calculated once per unique word and weighted by word frequency
+    syllables = count_syllables_batch(list(word_counts))
+    frequencies = np.fromiter(word_counts.values(), dtype=np.int64, count=n_unique_words)
+    n_syllables = int((syllables * frequencies).sum())
+    n_monosyllable_words = int(frequencies[syllables == 1].sum())
+    n_polysyllable_words = int(frequencies[syllables >= 3].sum())
 
     # Sentence length statistics
-    s_lengths, s_mean, s_median, s_stdev = sentence_lengths(doc)
+    s_mean, s_median, s_stdev = _sentence_length_stats(s_lengths)
     counts = {
         "n_chars": n_chars,
         "n_words": n_words,
@@ -142,10 +191,14 @@ def analyze_text(text):
 
 # Claude.ai
 
-import spacy
 from collections import defaultdict
 
 
+def _initials(phrase):
+    """Get the uppercased initial letters of the words in a phrase."""
+    return "".join(word[0].upper() for word in phrase.split() if word[0].isalpha())
+
+
 def extract_acronyms(doc):
     """
     Extract acronyms and their possible definitions from a spaCy Doc object.
@@ -158,93 +211,164 @@ def extract_acronyms(doc):
     """
     acronym_dict = defaultdict(list)
 
-    # Find potential acronyms (uppercase words with 2-5 letters)
-    acronyms = [
-        token.text
-        for token in doc
-        if token.text.isupper() and 2 <= len(token.text) <= 5
-    ]
-
-    # Find potential definitions
+    # In a single pass over the tokens, index the potential acronyms
+    # (uppercase words with 2-5 letters), grab the token texts for each sentence,
+    # and note where each opening bracket is
+    acronyms = set()
+    sents = []
+    brackets = []
     for sent in doc.sents:
+        texts = []
         for i, token in enumerate(sent):
-            if token.text == "(" and i > 0:
-                prev_tokens = sent[max(0, i - 5) : i]
-                next_token = sent[i + 1] if i + 1 < len(sent) else None
-
-                if next_token and next_token.text in acronyms:
-                    # Check if the previous words match the acronym
-                    potential_def = " ".join([t.text for t in prev_tokens])
-                    if next_token.text == "".join(
-                        word[0].upper()
-                        for word in potential_def.split()
-                        if word[0].isalpha()
-                    ):
-                        acronym_dict[next_token.text].append(potential_def)
-
-                elif prev_tokens[-1].text in acronyms:
-                    # Check if the next words match the acronym
-                    potential_def = []
-                    for j in range(i + 1, min(i + 6, len(sent))):
-                        if sent[j].text == ")":
-                            break
-                        potential_def.append(sent[j].text)
-                    potential_def = " ".join(potential_def)
-                    if prev_tokens[-1].text == "".join(
-                        word[0].upper()
-                        for word in potential_def.split()
-                        if word[0].isalpha()
-                    ):
-                        acronym_dict[prev_tokens[-1].text].append(potential_def)
+            text = token.text
+            texts.append(text)
+            if text == "(":
+                if i > 0:
+                    brackets.append((len(sents), i))
+            elif text.isupper() and 2 <= len(text) <= 5:
+                acronyms.add(text)
+        sents.append(texts)
+
+    if not acronyms:
+        return {}
+
+    # Find potential definitions in a window around each opening bracket
+    for s, i in brackets:
+        texts = sents[s]
+        next_text = texts[i + 1] if i + 1 < len(texts) else None
+
+        if next_text in acronyms:
+            # Check if the previous words match the acronym
+            potential_def = " ".join(texts[max(0, i - 5) : i])
+            if next_text == _initials(potential_def):
+                acronym_dict[next_text].append(potential_def)
+
+        elif texts[i - 1] in acronyms:
+            # Check if the next words match the acronym
+            potential_def = []
+            for j in range(i + 1, min(i + 6, len(texts))):
+                if texts[j] == ")":
+                    break
+                potential_def.append(texts[j])
+            potential_def = " ".join(potential_def)
+            if texts[i - 1] == _initials(potential_def):
+                acronym_dict[texts[i - 1]].append(potential_def)
 
     return dict(acronym_dict)
 
 
-import spacy
-try:
-    from sklearn.feature_extraction.text import TfidfVectorizer
-except:
-    print("Problem with sklearn")
+def merge_acronyms(acronym_dicts):
+    """
+    Merge acronym dictionaries, for example from each cell in a notebook
+    or each notebook in a corpus, into a single glossary.
+
+    Args:
+    acronym_dicts (iterable): Dictionaries of acronyms and their possible definitions
+
+    Returns:
+    dict: A dictionary of acronyms and all their possible definitions
+    """
+    glossary = defaultdict(list)
+    for acronym_dict in acronym_dicts:
+        for acronym, definitions in acronym_dict.items():
+            glossary[acronym].extend(definitions)
+    return dict(glossary)
+
+
 from collections import defaultdict
-import numpy as np
+
+
+def keyterm_text(doc):
+    """
+    Get the lemmatized text used for key term extraction from a spaCy Doc object.
+
+    Args:
+    doc (spacy.tokens.Doc): A spaCy Doc object with lemma annotations
+
+    Returns:
+    str: Lowercased lemmas, excluding stopwords, punctuation and non-alphabetic tokens
+    """
+    return " ".join(
+        token.lemma_.lower()
+        for token in doc
+        if not token.is_stop and not token.is_punct and token.is_alpha
+    )
+
+
+def fit_keyterms(documents, **kwargs):
+    """
+    Fit a TF-IDF vectorizer over a corpus of lemmatized documents.
+
+    Args:
+    documents (list): A list of lemmatized document strings, e.g. one per notebook
+    kwargs: Additional arguments passed to TfidfVectorizer
+
+    Returns:
+    tuple: The fitted vectorizer and the sparse TF-IDF matrix for the documents
+    """
+    # sklearn is slow to import, so only import it when we actually need it
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    kwargs.setdefault("dtype", np.float32)
+    vectorizer = TfidfVectorizer(**kwargs)
+    tfidf_matrix = vectorizer.fit_transform(documents)
+    return vectorizer, tfidf_matrix
+
+
+def top_keyterms(vectorizer, tfidf_matrix, n=10):
+    """
+    Get the top n terms for each row of a sparse TF-IDF matrix without densifying it.
+
+    Args:
+    vectorizer (TfidfVectorizer): The fitted vectorizer
+    tfidf_matrix (scipy.sparse matrix): TF-IDF scores, one row per document
+    n (int): Number of top terms to return for each row
+
+    Returns:
+    list: A list, one item per row, of lists of (term, score) tuples for the top n terms
+    """
+    feature_names = vectorizer.get_feature_names_out()
+    tfidf_matrix = tfidf_matrix.tocsr()
+    top_terms = []
+    for r in range(tfidf_matrix.shape[0]):
+        # Only look at the non-zero scores in the row
+        start, end = tfidf_matrix.indptr[r], tfidf_matrix.indptr[r + 1]
+        scores = tfidf_matrix.data[start:end]
+        terms = tfidf_matrix.indices[start:end]
+        if len(scores) > n:
+            top = np.argpartition(-scores, n)[:n]
+        else:
+            top = np.arange(len(scores))
+        # Order the top n by score, highest first
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top_terms.append([(feature_names[terms[i]], float(scores[i])) for i in top])
+    return top_terms
 
 
 def extract_keyterms_tfidf(doc, n=10):
     """
-    Extract key terms from a list of spaCy Doc objects using TF-IDF.
+    Extract key terms from a single spaCy Doc object using TF-IDF.
+
+    Key terms are better extracted at corpus scope, with the vectorizer
+    fitted over all the documents (see fit_keyterms and top_keyterms).
 
     Args:
-    docs (list): A list of spaCy Doc objects
+    doc (spacy.tokens.Doc): A spaCy Doc object
     n (int): Number of top terms to return
 
     Returns:
     list: A list of tuples (term, score) for the top n terms
     """
     # Preprocess: extract lemmatized tokens, excluding stopwords and punctuation
-    processed_doc =  " ".join(
-            [
-                token.lemma_.lower()
-                for token in doc
-                if not token.is_stop and not token.is_punct and token.is_alpha
-            ]
-        )
-       
-    # Create TF-IDF vectorizer
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(processed_doc)
-
-    # Get feature names (terms)
-    feature_names = np.array(vectorizer.get_feature_names_out())
-
-    # Calculate the average TF-IDF score for each term across all documents
-    avg_tfidf_scores = np.mean(tfidf_matrix.toarray(), axis=0)
+    processed_doc = keyterm_text(doc)
 
-    # Sort terms by their average TF-IDF score
-    sorted_indices = np.argsort(avg_tfidf_scores)[::-1]
-    top_terms = feature_names[sorted_indices][:n]
-    top_scores = avg_tfidf_scores[sorted_indices][:n]
+    try:
+        vectorizer, tfidf_matrix = fit_keyterms([processed_doc])
+    except ValueError:
+        # There are no terms to extract
+        return []
 
-    return list(zip(top_terms, top_scores))
+    return top_keyterms(vectorizer, tfidf_matrix, n)[0]
 
 
 def extract_keyterms(doc, n=10):
@@ -0,0 +1,119 @@
+# Deduplicated, content addressed store of cell text, so that cell reports
+# only need to carry a reference to the text rather than the text itself
+
+import os
+import struct
+import zlib
+from pathlib import Path
+
+import pandas as pd
+
+from .cell_cache import source_hash
+
+TEXT_STORE_MAGIC = b"NBQTEXT1"
+
+# Each entry in the store is a header (content hash, length of the stored text) followed by the stored text
+_ENTRY_HEADER = struct.Struct(">32sI")
+# The store header is the magic number, a compression flag and a random store id
+_STORE_HEADER = struct.Struct(">8s?16s")
+
+# The cell report columns that refer to the text in a store
+TEXT_REF_COLUMNS = ["text_hash", "text_offset", "text_length"]
+
+
+class TextStore:
+    """Append only file of cell text, with each distinct text stored once (optionally compressed).
+
+    Text is keyed by the hash of its content, and can be read back by hash or,
+    without the index, by its offset and length in the file. The text itself is
+    only read from disk when it is asked for."""
+
+    def __init__(self, path, compress=True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.path.is_file() or not self.path.stat().st_size:
+            with open(self.path, "wb") as f:
+                f.write(_STORE_HEADER.pack(TEXT_STORE_MAGIC, compress, os.urandom(16)))
+        self._file = open(self.path, "r+b")
+        magic, self.compress, store_id = _STORE_HEADER.unpack(self._file.read(_STORE_HEADER.size))
+        if magic != TEXT_STORE_MAGIC:
+            raise ValueError(f"{path} is not a text store")
+        # Identifies this particular store, e.g. so that stored reports don't refer to a store that's been replaced
+        self.store_id = store_id.hex()
+        self._index = {}
+        self._read_index()
+
+    def _read_index(self):
+        """Build the index of content hash to (offset, length) by scanning the entry headers."""
+        end = self._file.seek(0, os.SEEK_END)
+        offset = _STORE_HEADER.size
+        while offset + _ENTRY_HEADER.size <= end:
+            self._file.seek(offset)
+            _hash, length = _ENTRY_HEADER.unpack(self._file.read(_ENTRY_HEADER.size))
+            if offset + _ENTRY_HEADER.size + length > end:
+                break
+            self._index[_hash.hex()] = (offset + _ENTRY_HEADER.size, length)
+            offset = offset + _ENTRY_HEADER.size + length
+        # Drop any partly written entry left by an interrupted run
+        self._file.truncate(offset)
+
+    def put(self, text):
+        """Add some text to the store, if it isn't already there, and return its (hash, offset, length)."""
+        text_hash = source_hash(text)
+        if text_hash not in self._index:
+            data = text.encode("utf-8")
+            if self.compress:
+                data = zlib.compress(data)
+            offset = self._file.seek(0, os.SEEK_END)
+            self._file.write(_ENTRY_HEADER.pack(bytes.fromhex(text_hash), len(data)) + data)
+            self._index[text_hash] = (offset + _ENTRY_HEADER.size, len(data))
+        return (text_hash, *self._index[text_hash])
+
+    def read(self, offset, length):
+        """Read the text stored at a particular offset."""
+        self._file.seek(offset)
+        data = self._file.read(length)
+        if self.compress:
+            data = zlib.decompress(data)
+        return data.decode("utf-8")
+
+    def get(self, text_hash):
+        """Get some text by its content hash, or None if it isn't in the store."""
+        if text_hash not in self._index:
+            return None
+        return self.read(*self._index[text_hash])
+
+    def __contains__(self, text_hash):
+        return text_hash in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def flush(self):
+        """Write any buffered text to disk."""
+        self._file.flush()
+
+    def close(self):
+        """Flush and close the store."""
+        self._file.close()
+
+
+def store_report_text(ddf, text_store):
+    """Move the text from a cell report dataframe into a text store,
+    replacing the `text` column with references to the stored text."""
+    if "text" not in ddf:
+        return ddf
+    refs = [text_store.put(text) if isinstance(text, str) else (None, None, None) for text in ddf["text"]]
+    loc = ddf.columns.get_loc("text")
+    ddf = ddf.drop(columns="text")
+    for i, col in enumerate(TEXT_REF_COLUMNS):
+        ddf.insert(loc + i, col, [ref[i] for ref in refs])
+    return ddf
+
+
+def report_text(ddf, text_store):
+    """Get the text for each row of a cell report that refers to a text store."""
+    return [
+        None if pd.isna(offset) else text_store.read(int(offset), int(length))
+        for offset, length in zip(ddf["text_offset"], ddf["text_length"])
+    ]
@@ -0,0 +1,128 @@
+# Watch a path for notebook changes and rerun a report when they happen
+
+import os
+import threading
+import time
+from glob import glob
+from pathlib import Path
+
+# Wait until there have been no changes for this many seconds before rerunning a report,
+# so a burst of saves (or a notebook and its checkpoint) only triggers a single run
+WATCH_DEBOUNCE = 1.0
+
+# How often to check for changes, in seconds, if we have to poll the file system
+WATCH_POLL_INTERVAL = 1.0
+
+WATCH_EXCLUDE = [".ipynb_checkpoints", ".git", "__MACOSX"]
+
+
+def _watched(fn):
+    """Check whether changes to a file should trigger a rerun."""
+    fn = Path(fn)
+    return fn.suffix == ".ipynb" and not set(WATCH_EXCLUDE).intersection(fn.parts)
+
+
+def notebook_snapshot(path):
+    """Get the (modification time, size) of each notebook on a path, keyed by filename."""
+    snapshot = {}
+    for p in glob(path):
+        p = Path(p)
+        fns = p.rglob("*.ipynb") if p.is_dir() else [p]
+        for fn in fns:
+            if fn.is_file() and (_watched(fn) or fn == p):
+                stat = fn.stat()
+                snapshot[str(fn)] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def _watch_dirs(path):
+    """Get the directories to watch, and whether to watch them recursively."""
+    dirs = {}
+    for p in glob(path):
+        if os.path.isdir(p):
+            dirs[p] = True
+        else:
+            dirs.setdefault(os.path.dirname(p) or ".", False)
+    return dirs
+
+
+def _start_observer(path, changed):
+    """Watch for file system events using watchdog, if it is installed.
+
+    Returns the observer, or None if watchdog isn't available."""
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class _Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            fns = [event.src_path, getattr(event, "dest_path", "")]
+            if any(fn and (_watched(fn) or not os.path.splitext(fn)[1]) for fn in fns):
+                changed.set()
+
+    observer = Observer()
+    for _dir, recursive in _watch_dirs(path).items():
+        observer.schedule(_Handler(), _dir, recursive=recursive)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
+def _start_poller(path, changed, poll_interval):
+    """Watch for changes by polling notebook file stats in a background thread."""
+    # Take the first snapshot now, rather than in the thread, so changes made as soon as we return are seen
+    snapshot = notebook_snapshot(path)
+
+    def _poll():
+        nonlocal snapshot
+        while True:
+            time.sleep(poll_interval)
+            _snapshot = notebook_snapshot(path)
+            if _snapshot != snapshot:
+                snapshot = _snapshot
+                changed.set()
+
+    poller = threading.Thread(target=_poll, daemon=True)
+    poller.start()
+    return poller
+
+
+def watch(path, callback, debounce=WATCH_DEBOUNCE, poll_interval=WATCH_POLL_INTERVAL, first_run=None):
+    """Call `callback()` each time the notebooks on a path change, until interrupted.
+
+    If `first_run` is given, it is called once as soon as we are watching (e.g. to generate the
+    initial report), so that notebooks saved while it is running are picked up by a rerun.
+    Uses watchdog (inotify on Linux) to spot changes if it is installed,
+    otherwise polls the notebook file stats."""
+    changed = threading.Event()
+    observer = _start_observer(path, changed)
+    if observer is None:
+        _start_poller(path, changed, poll_interval)
+    # Take the snapshot before running anything, so a save made during a run always differs from it
+    snapshot = notebook_snapshot(path)
+    try:
+        if first_run is not None:
+            first_run()
+        while True:
+            changed.wait()
+            # Debounce: wait until things have gone quiet
+            changed.clear()
+            while changed.wait(debounce):
+                changed.clear()
+            # Ignore events that didn't actually change any notebooks
+            _snapshot = notebook_snapshot(path)
+            if _snapshot == snapshot:
+                continue
+            snapshot = _snapshot
+            try:
+                callback()
+            except Exception as e:
+                # Keep watching: the notebook may just have been caught mid-save
+                print(f"FAILED to update report: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer is not None:
+            observer.stop()
@@ -28,8 +28,14 @@ setup(
         "readtime",
         "list-imports",
         "pytest-codeblocks",
-        "radon", "pyflakes", "seaborn"
+        "radon", "pyflakes", "seaborn",
+        "requests"
     ],
+    extras_require={
+        # Faster link checking
+        "aiohttp": ["aiohttp"]
+    },
+    python_requires=">=3.7",
     entry_points="""
         [console_scripts]
         nb_quality=nb_quality_profile.cli:cli
@@ -0,0 +1,40 @@
+import nbformat
+import pytest
+
+from nb_quality_profile import notebook_profiler
+from nb_quality_profile.nb_visualiser import nb_big_parse_nb, required_inputs, _run_analysers, NB_ANALYSERS
+from nb_quality_profile.notebook_profiler import NotebookContext
+
+from test_incremental import write_notebook
+
+
+def test_required_inputs_are_the_closure_of_the_declared_inputs():
+    assert required_inputs(['cell_map']) == {'cells'}
+    assert required_inputs(['links_and_images']) == {'html', 'markdown', 'cells'}
+    assert required_inputs(['imports', 'warnings']) == {'code', 'outputs', 'cells'}
+    assert 'spacy' in required_inputs(['big_report'])
+    assert 'spacy' not in required_inputs([a for a in NB_ANALYSERS if a != 'big_report'])
+
+
+@pytest.mark.parametrize("analyses", [['cell_map'], ['imports'], ['text_report'], ['links_and_images'], ['warnings']])
+def test_only_the_required_inputs_are_computed(analyses):
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [nbformat.v4.new_markdown_cell("Some [text](http://example.com)."),
+                nbformat.v4.new_code_cell("import os")]
+    ctx = NotebookContext(nb)
+    reports = _run_analysers(ctx, analyses)
+    assert list(reports) == analyses
+    assert set(ctx._artefacts) == required_inputs(analyses)
+
+
+def test_reports_without_the_big_report_never_load_spacy(tmp_path, monkeypatch):
+    write_notebook(tmp_path / "a.ipynb", "os", "sys")
+
+    def get_nlp(*args, **kwargs):
+        raise AssertionError("spacy was loaded")
+
+    monkeypatch.setattr(notebook_profiler, "get_nlp", get_nlp)
+    reports = nb_big_parse_nb(str(tmp_path), analyses=[a for a in NB_ANALYSERS if a != 'big_report'])
+    assert sorted(reports['imports'][tmp_path / "a.ipynb"]) == ["os", "sys"]
+    with pytest.raises(AssertionError, match="spacy was loaded"):
+        nb_big_parse_nb(str(tmp_path), analyses=['big_report'])
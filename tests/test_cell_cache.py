@@ -0,0 +1,58 @@
+from nb_quality_profile.cell_cache import CellCache, IN_MEMORY, read_file
+
+
+def _stored_size(cache):
+    return cache.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cells").fetchone()[0]
+
+
+def test_size_counts_each_key_once():
+    cache = CellCache(IN_MEMORY)
+    cache.put("a", {"n_words": 1})
+    cache.put("b", {"n_words": 2})
+    # Replacing a report shouldn't count the old one as well
+    cache.put("a", {"n_words": 1, "n_sents": 1})
+    cache.put("a", {"n_words": 3})
+    assert cache.size() == _stored_size(cache)
+
+
+def test_size_after_eviction():
+    cache = CellCache(IN_MEMORY, max_size=400)
+    for i in range(20):
+        cache.put(str(i % 5), {"text": "x" * 40, "i": i})
+    # Five distinct cells fit, so nothing should be evicted
+    assert cache.size() == _stored_size(cache) <= 400
+    cache.flush()
+    assert cache.conn.execute("SELECT COUNT(*) FROM cells").fetchone()[0] == 5
+
+
+def _stored_file_size(cache):
+    return cache.conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM files").fetchone()[0]
+
+
+def test_file_reports_count_towards_the_size_and_are_evicted(tmp_path):
+    cache = CellCache(IN_MEMORY)
+    fns = []
+    for i in range(4):
+        fn = tmp_path / f"nb{i}.ipynb"
+        fn.write_text(f"notebook {i}")
+        fns.append(fn)
+        cache.put_file(fn, "chart", {"cell_map": [(i, "red")], "text": "x" * 300}, read_file(fn)[1])
+    # Storing the reports for the same file again replaces them
+    cache.put_file(fns[0], "chart", {"cell_map": [(0, "red")], "text": "x" * 300}, read_file(fns[0])[1])
+    assert 0 < _stored_file_size(cache) == cache.size()
+    # Room for six files' reports
+    cache.max_size = cache.size() * 6 // 4
+
+    # The reports for a file that has been used recently are kept
+    assert cache.get_file(fns[0], "chart") is not None
+    for i in range(4):
+        cache.put_file(fns[i], "imports", {"imports": ["os"], "text": "y" * 300}, read_file(fns[i])[1])
+    cache.flush()
+    assert cache.size() == _stored_file_size(cache) <= cache.max_size
+    assert cache.get_file(fns[0], "chart") is not None
+    assert cache.get_file(fns[1], "chart") is None
+
+    # Forgetting a deleted file frees up the space its reports took
+    fns[3].unlink()
+    cache.prune_files([tmp_path], fns[:3])
+    assert cache.size() == _stored_file_size(cache)
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from nb_quality_profile.notebook_profiler import (
+    compact_report,
+    split_report,
+    report_memory_per_cell,
+    CODE_REPORT_SCHEMA,
+    MD_REPORT_SCHEMA,
+    REPORT_SCHEMA,
+)
+
+
+def synthetic_report(n_notebooks=500, cells_per_notebook=40, seed=0):
+    """Make a combined cell report for a large corpus, with the markdown and code columns the profiler generates."""
+    rng = np.random.default_rng(seed)
+    records = []
+    for nb in range(n_notebooks):
+        path = f"course/part{nb % 12}"
+        for i in range(cells_per_notebook):
+            record = {"filename": f"{path}/nb{nb}.ipynb", "path": path, "name": f"nb{nb}.ipynb",
+                      "cell_index": i, "text": f"cell {i} of notebook {nb}"}
+            if rng.random() < 0.6:
+                record.update({col: float(rng.integers(0, 500)) for col, kind in MD_REPORT_SCHEMA.items()
+                               if kind == "count"})
+                record.update({col: float(rng.normal(50, 20)) for col, kind in MD_REPORT_SCHEMA.items()
+                               if kind == "float"})
+                record.update({"cell_type": "md", "sentence_legths": list(rng.integers(1, 30, 3)),
+                               "acronyms": [], "keyterms": [("notebook", 0.5)], "keyterm_text": "notebook"})
+            else:
+                record.update({col: float(rng.integers(0, 60)) for col, kind in CODE_REPORT_SCHEMA.items()
+                               if kind == "count"})
+                record.update({"cell_type": "code", "reading_time_s": float(rng.normal(20, 5))})
+            records.append(record)
+    ddf = pd.DataFrame(records)
+    # Some cells whose path is missing, e.g. from a raw notebook
+    ddf.loc[ddf.index % 997 == 0, "path"] = np.nan
+    return ddf
+
+
+def _values(s):
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def assert_same_values(back, ddf):
+    """Check a compacted report holds the same values as the original report."""
+    back = back.set_index(["filename", "cell_index"]).sort_index()
+    ddf = ddf.assign(cell_index=ddf["cell_index"].astype("UInt64")).set_index(["filename", "cell_index"]).sort_index()
+    assert list(back.index) == list(ddf.index)
+    for col in ddf.columns:
+        kind = REPORT_SCHEMA.get(col)
+        if kind in ("count", "float"):
+            np.testing.assert_allclose(back[col].astype(float), ddf[col].astype(float), rtol=1e-6)
+        else:
+            assert _values(back[col]) == _values(ddf[col]), col
+
+
+def test_missing_categories_stay_missing():
+    ddf = pd.DataFrame({"filename": ["a.ipynb", None, np.nan], "cell_type": ["md", "code", "md"]})
+    compact = compact_report(ddf)
+    assert compact["filename"].isna().tolist() == [False, True, True]
+    assert list(compact["filename"].cat.categories) == ["a.ipynb"]
+
+
+def test_compact_report_is_smaller_and_round_trips():
+    ddf = synthetic_report()
+    compact = compact_report(ddf)
+    split = split_report(ddf)
+
+    per_cell = report_memory_per_cell(ddf)
+    assert report_memory_per_cell(compact) < 0.75 * per_cell
+    assert report_memory_per_cell(split) < report_memory_per_cell(compact)
+
+    assert_same_values(compact, ddf)
+    # Each split table only has its own columns; the concatenation fills in the others as missing
+    back = pd.concat([split["md"].astype(object), split["code"].astype(object)], ignore_index=True, sort=False)
+    assert len(back) == len(ddf)
+    assert_same_values(back, ddf)
@@ -0,0 +1,101 @@
+import json
+import os
+
+import nbformat
+import pandas as pd
+import pytest
+
+from nb_quality_profile import nb_visualiser
+from nb_quality_profile.cell_cache import CellCache
+from nb_quality_profile.nb_visualiser import nb_big_parse_nb, DEFAULT_ANALYSES, NB_ANALYSERS
+
+FAST_ANALYSES = ['cell_map', 'imports', 'text_report']
+
+
+def write_notebook(fn, *sources, bump_mtime=True):
+    """Write a notebook with a markdown cell and a code cell for each source, making sure its mtime changes."""
+    nb = nbformat.v4.new_notebook()
+    for source in sources:
+        nb.cells.append(nbformat.v4.new_markdown_cell(f"Some text about {source}. It is quite short."))
+        nb.cells.append(nbformat.v4.new_code_cell(f"import {source}\n{source}.run()"))
+    mtime = os.stat(fn).st_mtime_ns if os.path.exists(fn) else None
+    nbformat.write(nb, str(fn))
+    if bump_mtime and mtime is not None:
+        # Don't rely on the file system's timestamp resolution to tell the saves apart
+        os.utime(fn, ns=(mtime + 10**9, mtime + 10**9))
+
+
+def profile(path, analyses, cell_cache=None):
+    return nb_big_parse_nb(str(path), analyses=analyses, cell_cache=cell_cache)
+
+
+def assert_same_reports(reports, expected, analyses):
+    for analysis in ['cell_map', 'imports', 'text_report', 'links_and_images', 'warnings']:
+        if analysis in analyses:
+            assert reports[analysis] == expected[analysis]
+    if 'big_report' in analyses:
+        pd.testing.assert_frame_equal(reports['big_report_df'], expected['big_report_df'])
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    nb_dir = tmp_path / "notebooks"
+    nb_dir.mkdir()
+    write_notebook(nb_dir / "a.ipynb", "os", "sys")
+    write_notebook(nb_dir / "b.ipynb", "json")
+    write_notebook(nb_dir / "c.ipynb", "math", "re", "csv")
+    return nb_dir
+
+
+@pytest.mark.parametrize("analyses", [FAST_ANALYSES, DEFAULT_ANALYSES, sorted(NB_ANALYSERS)])
+def test_incremental_runs_match_cold_runs(corpus, tmp_path, analyses):
+    cache = CellCache(tmp_path / "cache")
+    assert_same_reports(profile(corpus, analyses, cache), profile(corpus, analyses), analyses)
+
+    # Edited
+    write_notebook(corpus / "a.ipynb", "os", "glob")
+    assert_same_reports(profile(corpus, analyses, cache), profile(corpus, analyses), analyses)
+
+    # Touched, but not changed
+    stat = os.stat(corpus / "b.ipynb")
+    os.utime(corpus / "b.ipynb", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert_same_reports(profile(corpus, analyses, cache), profile(corpus, analyses), analyses)
+
+    # Deleted
+    os.remove(corpus / "c.ipynb")
+    reports = profile(corpus, analyses, cache)
+    assert_same_reports(reports, profile(corpus, analyses), analyses)
+    assert corpus / "c.ipynb" not in reports['cell_map']
+    cache.close()
+
+
+def test_stored_reports_are_json_and_parquet(corpus, tmp_path):
+    cache = CellCache(tmp_path / "cache")
+    profile(corpus, DEFAULT_ANALYSES, cache)
+    for reports, cells in cache.conn.execute("SELECT reports, cells FROM files"):
+        json.loads(reports)
+        assert cells.startswith(b"PAR1")
+    cache.close()
+
+
+def test_edit_during_processing_is_picked_up(corpus, tmp_path, monkeypatch):
+    cache = CellCache(tmp_path / "cache")
+    run_analysers = nb_visualiser._run_analysers
+    saved = []
+
+    def _run_analysers(ctx, analyses, **kwargs):
+        # Save a new version of the notebook after it has been read, but before its reports are stored
+        if ctx.fn.name == "a.ipynb" and not saved:
+            write_notebook(ctx.fn, "os", "pathlib")
+            saved.append(ctx.fn)
+        return run_analysers(ctx, analyses, **kwargs)
+
+    monkeypatch.setattr(nb_visualiser, "_run_analysers", _run_analysers)
+    profile(corpus, FAST_ANALYSES, cache)
+    assert saved
+    monkeypatch.undo()
+
+    reports = profile(corpus, FAST_ANALYSES, cache)
+    assert_same_reports(reports, profile(corpus, FAST_ANALYSES), FAST_ANALYSES)
+    assert "pathlib" in reports['imports'][corpus / "a.ipynb"]
+    cache.close()
@@ -0,0 +1,154 @@
+import collections
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import nbformat
+import pytest
+from click.testing import CliRunner
+
+from nb_quality_profile import link_checker
+from nb_quality_profile.cli import cli
+from nb_quality_profile.link_checker import check_links, LINK_ERROR_REASON
+
+_fetcher = link_checker._fetcher
+
+REDIRECTS = {"/redirect": (301, "/moved"), "/moved": (302, "/ok")}
+
+
+class StubServer:
+    """A local HTTP server that counts the requests for each path and how many are in flight at once."""
+
+    def __init__(self):
+        self.hits = collections.Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                with stub.lock:
+                    stub.hits[self.path] += 1
+                    hits = stub.hits[self.path]
+                if self.path in REDIRECTS:
+                    status, location = REDIRECTS[self.path]
+                    self.send_response(status)
+                    self.send_header("Location", location)
+                elif self.path == "/missing":
+                    self.send_response(404)
+                elif self.path == "/flaky":
+                    # Unavailable the first time, fine after that
+                    self.send_response(503 if hits == 1 else 200)
+                elif self.path == "/hang":
+                    time.sleep(2)
+                    self.send_response(200)
+                elif self.path.startswith("/slow"):
+                    with stub.lock:
+                        stub.in_flight += 1
+                        stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    time.sleep(0.2)
+                    with stub.lock:
+                        stub.in_flight -= 1
+                    self.send_response(200)
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def server():
+    stub = StubServer()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture(params=["aiohttp", "requests"], autouse=True)
+def fetcher(request, monkeypatch):
+    """Run each test with both the aiohttp and the requests fetchers."""
+    if request.param == "aiohttp":
+        pytest.importorskip("aiohttp")
+        monkeypatch.setattr(link_checker, "_fetcher", link_checker._AiohttpFetcher)
+    else:
+        pytest.importorskip("requests")
+        monkeypatch.setattr(link_checker, "_fetcher", link_checker._RequestsFetcher)
+    return request.param
+
+
+def test_redirect_chain(server):
+    url = server.url + "/redirect"
+    assert check_links([url])[url] == [
+        (True, server.url + "/redirect", 301, "Moved Permanently"),
+        (True, server.url + "/moved", 302, "Found"),
+        (True, server.url + "/ok", 200, "OK"),
+    ]
+
+
+def test_not_found(server):
+    url = server.url + "/missing"
+    assert check_links([url])[url] == [(False, url, 404, "Not Found")]
+    # Client errors aren't retried
+    assert server.hits["/missing"] == 1
+
+
+def test_server_error_is_retried(server):
+    url = server.url + "/flaky"
+    assert check_links([url], backoff=0.01)[url] == [(True, url, 200, "OK")]
+    assert server.hits["/flaky"] == 2
+
+
+def test_timeout(server):
+    url = server.url + "/hang"
+    assert check_links([url], timeout=0.2, retries=0)[url] == [(False, url, None, LINK_ERROR_REASON)]
+
+
+def test_unresolvable_links_are_not_fetched(server):
+    reports = check_links(["#section", "mailto:someone@example.com", "images/figure.png"])
+    assert reports == {url: [(False, url, None, LINK_ERROR_REASON)] for url in reports}
+    assert not server.hits
+
+
+def test_each_distinct_url_is_fetched_once(server):
+    urls = [server.url + path for path in ["/ok", "/redirect", "/ok", "/missing", "/redirect", "/ok"]]
+    reports = check_links(urls)
+    assert list(reports) == [server.url + path for path in ["/ok", "/redirect", "/missing"]]
+    # The redirect ends up at /ok too, but the checks for the two links are separate
+    assert server.hits == {"/ok": 2, "/redirect": 1, "/moved": 1, "/missing": 1}
+
+
+def test_host_concurrency_limit(server):
+    urls = [server.url + f"/slow{i}" for i in range(8)]
+    reports = check_links(urls, host_concurrency=2)
+    assert all(report[-1][0] for report in reports.values())
+    assert server.max_in_flight == 2
+
+
+def test_link_check_without_an_http_library(tmp_path, monkeypatch):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell("See [the docs](https://example.com/docs)."))
+    nbformat.write(nb, str(tmp_path / "nb.ipynb"))
+    monkeypatch.setattr(link_checker, "_fetcher", _fetcher)
+    # Neither aiohttp nor requests can be imported
+    monkeypatch.setitem(sys.modules, "aiohttp", None)
+    monkeypatch.setitem(sys.modules, "requests", None)
+    result = CliRunner().invoke(cli, ["link-check", str(tmp_path), "--no-cache"])
+    assert result.exit_code == 1
+    assert "pip install requests" in result.output
+    assert "Traceback" not in result.output
@@ -0,0 +1,74 @@
+import json
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from nb_quality_profile.cli import cli
+from nb_quality_profile.nb_visualiser import nb_big_parse_nb, collect_notebook_reports
+from nb_quality_profile.shards import read_partial_results, PARTIAL_CELLS, PARTIAL_META
+
+from test_incremental import write_notebook
+
+ANALYSES = ['big_report', 'cell_map', 'imports', 'links_and_images', 'warnings']
+N_SHARDS = 3
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    nb_dir = tmp_path / "notebooks"
+    (nb_dir / "part1").mkdir(parents=True)
+    for i, packages in enumerate([("os",), ("sys", "json"), ("math",), ("re", "csv"), ("glob",), ("time",)]):
+        write_notebook(nb_dir / ("part1" if i % 2 else "") / f"nb{i}.ipynb", *packages)
+    return nb_dir
+
+
+def profile_shards(corpus, tmp_path, n=N_SHARDS):
+    partials = [tmp_path / f"shard_{i}" for i in range(1, n + 1)]
+    for i, partial in enumerate(partials, 1):
+        nb_big_parse_nb(str(corpus), analyses=ANALYSES, nlp_profile='minimal', shard=(i, n), partial_out=partial)
+    return partials
+
+
+def test_merged_shards_match_a_single_run(corpus, tmp_path):
+    single = nb_big_parse_nb(str(corpus), analyses=ANALYSES, nlp_profile='minimal')
+    partials = profile_shards(corpus, tmp_path)
+    # The partial results are plain JSON and Parquet
+    for partial in partials:
+        assert sorted(p.name for p in partial.iterdir()) == sorted([PARTIAL_CELLS, PARTIAL_META])
+        json.loads((partial / PARTIAL_META).read_text())
+
+    meta, notebook_reports = read_partial_results(partials)
+    merged = collect_notebook_reports(notebook_reports)
+    pd.testing.assert_frame_equal(merged["big_report_df"], single["big_report_df"])
+    for report in ["cell_map", "imports", "links_and_images", "warnings", "keyterms"]:
+        assert merged[report] == single[report]
+    assert list(merged["cell_map"]) == list(single["cell_map"])
+
+
+def test_shards_from_different_notebooks_are_refused(corpus, tmp_path):
+    partials = profile_shards(corpus, tmp_path)
+    # Redo one shard after a notebook has been added
+    write_notebook(corpus / "nb_new.ipynb", "os")
+    nb_big_parse_nb(str(corpus), analyses=ANALYSES, nlp_profile='minimal', shard=(1, N_SHARDS),
+                    partial_out=partials[0])
+    with pytest.raises(ValueError, match="different notebooks"):
+        read_partial_results(partials)
+
+
+def test_missing_or_incomplete_shards_are_refused(corpus, tmp_path):
+    partials = profile_shards(corpus, tmp_path)
+    with pytest.raises(ValueError, match="missing: \\[2\\]"):
+        read_partial_results([partials[0], partials[2]])
+    with pytest.raises(ValueError, match="Can't read partial results"):
+        read_partial_results([*partials[:2], tmp_path / "no_such_shard"])
+    (partials[1] / PARTIAL_META).write_bytes(b"\x80\x04not json")
+    with pytest.raises(ValueError, match="not a partial results directory"):
+        read_partial_results(partials)
+
+
+def test_merge_reports_missing_partials_without_a_traceback(tmp_path):
+    result = CliRunner().invoke(cli, ["merge", str(tmp_path / "no_such_shard")])
+    assert result.exit_code == 1
+    assert "Can't read partial results" in result.output
+    assert "Traceback" not in result.output
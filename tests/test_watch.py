@@ -0,0 +1,52 @@
+import os
+import signal
+import threading
+
+from nb_quality_profile import nb_visualiser
+from nb_quality_profile.cell_cache import CellCache
+from nb_quality_profile.nb_visualiser import nb_big_parse_nb
+from nb_quality_profile.watch import watch
+
+from test_incremental import write_notebook
+
+# Give up, rather than hang, if a rerun never happens
+WATCH_TEST_TIMEOUT = 30
+
+
+def test_save_during_a_run_triggers_a_rerun(tmp_path, monkeypatch):
+    nb_dir = tmp_path / "notebooks"
+    nb_dir.mkdir()
+    nb_fn = nb_dir / "a.ipynb"
+    write_notebook(nb_fn, "os")
+    cache = CellCache(tmp_path / "cache")
+    versions = iter(["sys", "json"])
+    runs = []
+
+    run_analysers = nb_visualiser._run_analysers
+
+    def _run_analysers(ctx, analyses, **kwargs):
+        # Save a new version of the notebook during the first run and the first rerun,
+        # after it has been read but before its reports are stored
+        if len(runs) < 2:
+            write_notebook(ctx.fn, "os", next(versions))
+        return run_analysers(ctx, analyses, **kwargs)
+
+    monkeypatch.setattr(nb_visualiser, "_run_analysers", _run_analysers)
+
+    def report():
+        reports = nb_big_parse_nb(str(nb_dir), analyses=['imports'], cell_cache=cache)
+        runs.append(sorted(reports['imports'][nb_fn]))
+        if len(runs) == 3:
+            raise KeyboardInterrupt
+
+    # A real SIGINT, which (unlike `_thread.interrupt_main()`) also wakes up a blocked wait
+    timeout = threading.Timer(WATCH_TEST_TIMEOUT, os.kill, (os.getpid(), signal.SIGINT))
+    timeout.start()
+    try:
+        watch(str(nb_dir), report, debounce=0.1, poll_interval=0.1, first_run=report)
+    finally:
+        timeout.cancel()
+    cache.close()
+
+    # Each run sees the version that was saved during the run before it
+    assert runs == [["os"], ["os", "sys"], ["json", "os"]]